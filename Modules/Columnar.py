@@ -0,0 +1,127 @@
+"""
+Columnar Option Parameters
+
+
+rows of OptionPricing parameters (and any other numeric fields) held in one
+numpy structured array, so that a whole set of positions can be priced by a
+single instance of its class with array valued parameters
+
+this is the storage shared by Portfolio, TradeStore and TickPricer
+
+    table = Columnar([('notional', 'f8')])
+    i = table.append(BSCall(mat=1, strike=100, spot=100, sig=0.2), notional=10)
+    table.option(BSCall).PV()           # one PV per row
+    table.column('spot')[:] = 101       # a (writeable) view of one field
+
+the first n rows of the array are in use, and it grows by doubling; a row is
+removed by moving the last row into its place
+
+
+DEPENDENCIES
+
+numpy
+
+
+AUTHOR AND COPYRIGHT
+
+Copyright (c) 2014
+Stefan LOESCH, oditorium
+http://www.oditorium.com
+
+
+IMPORTANT LEGAL INFORMATION
+
+This software is distributed WITHOUT ANY WARRANTY and without even the
+implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE,
+and it does NOT CONSTITUTE INVESTMENT ADVICE. It shall not be used for
+other than academic purposes, and in particular IT SHOULD NOT BE RELIED
+UPON TO PRICE OR RISK MANAGE ACTUAL PORTFOLIOS.
+
+This software is licensed under the Gnu AGPL v3.0. See the LICENSE file
+or see http://www.gnu.org/licenses/
+
+"""
+
+__version__ = "0.1a"
+
+#-----------------------------------------------------------------------------
+#  Copyright (c) 2014  Stefan LOESCH, oditorium
+#
+#  Distributed under the terms of the AGPL License.
+#
+#  The full license is in the file LICENSE, distributed with this software.
+#-----------------------------------------------------------------------------
+
+import numpy as np
+
+# the parameters of the Black-Scholes type classes of OptionPricing
+PARAMS = ('mat', 'strike', 'rate', 'yld', 'sig', 'spot', 'time')
+
+
+class Columnar:
+    """ rows of named numeric fields in one growable numpy structured array
+
+    Columnar(fields, capacity, array, params)
+        fields - list of (name, dtype) of the fields besides the parameters
+        capacity - the initial number of rows
+        array - an existing structured array to use (eg a memory mapped one;
+                    all its rows are in use, and fields is ignored)
+        params - the OptionPricing parameters held (after fields)
+    """
+
+    __version__ = "0.1a"
+
+    def __init__(self, fields=(), capacity=16, array=None, params=PARAMS):
+        self.params = tuple(params)
+        if array is None:
+            array = np.zeros(capacity, dtype=list(fields) + [(p, 'f8') for p in self.params])
+            self.n = 0
+        else: self.n = len(array)
+        self.a = array
+
+    def __len__(self):
+        return self.n
+
+    def _grow(self):
+        a = np.zeros(max(2*len(self.a), 16), dtype=self.a.dtype)
+        a[:self.n] = self.a[:self.n]
+        self.a = a
+
+    def append(self, option=None, **values):
+        """ appends a row, and returns its index
+
+        option - if not None, the params are copied from its attributes
+        values - the values of (other) fields, eg notional=10
+        """
+        if not self.a.flags.writeable: raise ValueError("the table is read only")
+        if self.n == len(self.a): self._grow()
+        row = self.a[self.n]
+        if option is not None:
+            for p in self.params: row[p] = getattr(option, p)
+        for k, v in values.items(): row[k] = v
+        self.n += 1
+        return self.n - 1
+
+    def remove(self, i):
+        """ removes row i, by moving the last row into its place
+        """
+        last = self.n - 1
+        if i != last: self.a[i] = self.a[last]
+        self.n = last
+
+    def column(self, name):
+        """ the field name of the rows in use, as a view
+        """
+        return self.a[name][:self.n]
+
+    def rows(self):
+        """ the rows in use, as a view
+        """
+        return self.a[:self.n]
+
+    def option(self, cls, idx=None):
+        """ one instance of cls, with the params of the rows idx (default:
+        all rows in use) as array parameters
+        """
+        rows = self.a[:self.n] if idx is None else self.a[idx]
+        return cls(**{p: rows[p] for p in self.params})
@@ -0,0 +1,235 @@
+"""
+Credit Portfolio Loss Simulation
+
+
+Monte Carlo simulation of the loss distribution of a credit portfolio in the
+one-factor Gaussian model (as in the MCRisk1-LargePoolCap notebook): name i
+defaults iff
+
+    rho M + sqrt(1-rho^2) e_i < N^-1(pd)
+
+where M (the systematic factor) and the e_i (idiosyncratic) are independent
+standard normals
+
+Pool - the portfolio, as segments of identical names
+LossDistribution - streaming histogram of the losses, with VaR and ES
+simulate - runs the simulation in chunks of fixed size
+large_pool_quantile - the closed form quantile of the default rate of an
+    infinitely granular pool (Vasicek), eg for checking the simulation
+
+rather than drawing the d+1 normals of every scenario and multiplying them
+with a dense loading matrix (O(N d^2)), the simulation uses the one-factor
+structure directly: given M the names default independently with probability
+
+    p(M) = N( (N^-1(pd) - rho M) / sqrt(1-rho^2) )
+
+so the number of defaults in a segment of n identical names is a single
+binomial(n, p(M)) draw; a pool of d different names costs O(N d), a
+homogeneous pool of any size O(N); the scenarios are generated in chunks,
+and only the histogram of the losses is kept, so the memory needed does not
+depend on the number of scenarios
+
+    pool = Pool(pd=0.01, exposure=0.4, rho=0.1, count=1000)
+    dist = simulate(pool, 10**7, seed=1)
+    dist.VaR(0.999), dist.ES(0.999)
+
+
+DEPENDENCIES
+
+numpy
+scipy
+
+
+AUTHOR AND COPYRIGHT
+
+Copyright (c) 2014
+Stefan LOESCH, oditorium
+http://www.oditorium.com
+
+
+IMPORTANT LEGAL INFORMATION
+
+This software is distributed WITHOUT ANY WARRANTY and without even the
+implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE,
+and it does NOT CONSTITUTE INVESTMENT ADVICE. It shall not be used for
+other than academic purposes, and in particular IT SHOULD NOT BE RELIED
+UPON TO PRICE OR RISK MANAGE ACTUAL PORTFOLIOS.
+
+This software is licensed under the Gnu AGPL v3.0. See the LICENSE file
+or see http://www.gnu.org/licenses/
+
+"""
+
+__version__ = "0.1a"
+
+#-----------------------------------------------------------------------------
+#  Copyright (c) 2014  Stefan LOESCH, oditorium
+#
+#  Distributed under the terms of the AGPL License.
+#
+#  The full license is in the file LICENSE, distributed with this software.
+#-----------------------------------------------------------------------------
+
+from math import sqrt
+import numpy as np
+from scipy.special import ndtr, ndtri
+
+
+class Pool:
+    """ a credit portfolio, as segments of identical names
+
+    PARAMETERS (scalars or arrays, one entry per segment, broadcast)
+        pd - default probability of each name
+        exposure - loss given default of each name (ie EAD x LGD)
+        rho - loading of each name on the systematic factor
+        count - number of names in the segment (default 1, ie one
+                    segment per name)
+    """
+
+    __version__ = "0.1a"
+
+    def __init__(self, pd, exposure=1.0, rho=0.0, count=1):
+        pd, exposure, rho, count = np.broadcast_arrays(*(np.atleast_1d(x) for x in (pd, exposure, rho, count)))
+        self.pd = pd.astype(float)
+        self.exposure = exposure.astype(float)
+        self.rho = rho.astype(float)
+        self.count = count.astype(int)
+        self._threshold = ndtri(self.pd)
+        self._idio = np.sqrt(1.0 - self.rho * self.rho)
+        # single names are drawn as uniform < p, which is much faster than binomial
+        self._single = np.flatnonzero(self.count == 1)
+        self._multi = np.flatnonzero(self.count != 1)
+
+    def __len__(self):
+        return int(self.count.sum())
+
+    def max_loss(self):
+        """ the loss if all names default
+        """
+        return float(np.dot(self.count, self.exposure))
+
+    def expected_loss(self):
+        """ the expected loss (sum of pd x exposure)
+        """
+        return float(np.dot(self.count, self.pd * self.exposure))
+
+    def losses(self, rng, n):
+        """ the losses of n scenarios, drawn from the numpy Generator rng
+        """
+        m = rng.standard_normal((n, 1))
+        loss = np.zeros(n)
+        for idx in (self._single, self._multi):
+            if len(idx) == 0: continue
+            p = ndtr((self._threshold[idx] - self.rho[idx] * m) / self._idio[idx])
+            if idx is self._single: defaults = rng.random(p.shape) < p
+            else: defaults = rng.binomial(self.count[idx], p)
+            loss += np.dot(defaults, self.exposure[idx])
+        return loss
+
+
+class LossDistribution:
+    """ streaming histogram of simulated losses
+
+    the losses are counted in bins of width `width`, bin k collecting the
+    losses in [(k-1/2) width, (k+1/2) width); the quantiles are therefore
+    accurate to width/2, and exact if all losses are multiples of width
+    (eg for integer exposures and width 1); the histogram grows as needed,
+    so its size is max loss / width whatever the number of losses added
+    """
+
+    __version__ = "0.1a"
+
+    def __init__(self, width=1.0):
+        self.width = float(width)
+        self.counts = np.zeros(1, dtype=np.int64)
+        self.n = 0
+        self.total = 0.0
+
+    def update(self, losses):
+        """ adds an array of losses to the histogram
+        """
+        losses = np.asarray(losses, dtype=float)
+        k = np.rint(losses / self.width).astype(np.int64)
+        c = np.bincount(k, minlength=len(self.counts))
+        c[:len(self.counts)] += self.counts
+        self.counts = c
+        self.n += len(losses)
+        self.total += float(losses.sum())
+
+    def values(self):
+        """ the loss values represented by the bins
+        """
+        return self.width * np.arange(len(self.counts))
+
+    def mean(self):
+        """ the mean loss
+        """
+        return self.total / self.n
+
+    def cdf(self, loss):
+        """ the probability that the loss is at most loss
+        """
+        k = int(np.floor(loss / self.width + 0.5 + 1e-9))
+        return float(self.counts[:max(k+1, 0)].sum()) / self.n
+
+    def VaR(self, alpha=0.999):
+        """ the value at risk at confidence level alpha, ie the smallest loss
+        l for which P(L <= l) >= alpha
+        """
+        cum = np.cumsum(self.counts)
+        k = int(np.searchsorted(cum, alpha * self.n - 1e-9 * self.n))
+        return k * self.width
+
+    def ES(self, alpha=0.999):
+        """ the expected shortfall at confidence level alpha, ie the average
+        of the losses in the worst 1-alpha of the scenarios (with the
+        scenarios at the VaR itself counted pro rata)
+        """
+        var = self.VaR(alpha)
+        k = int(round(var / self.width))
+        v = self.values()
+        tail = float(np.dot(self.counts[k+1:], v[k+1:])) / self.n
+        atvar = var * (float(self.counts[:k+1].sum()) / self.n - alpha)
+        return (tail + atvar) / (1.0 - alpha)
+
+
+def simulate(pool, N, seed=None, chunk=None, width=None, dist=None):
+    """ simulates N loss scenarios of pool, in chunks of size chunk
+
+    PARAMETERS
+        pool - the Pool (or any object with a method losses(rng, n))
+        N - the number of scenarios
+        seed - the seed of the numpy Generator (or the Generator itself)
+        chunk - the number of scenarios generated in one go; the memory
+                    needed is O(chunk x number of segments), and the default
+                    keeps that to about 10^6 draws (but at most 10^5 scenarios)
+        width - the bin width of the loss histogram (default: the smallest
+                    exposure if all exposures are multiples of it, which
+                    makes the histogram exact, otherwise max loss / 10000)
+        dist - an existing LossDistribution to be added to (eg to extend a
+                    simulation; width is then ignored)
+
+    RETURNS
+        the LossDistribution
+    """
+    if dist is None:
+        if width is None:
+            e = pool.exposure
+            unit = float(np.min(e[e > 0])) if np.any(e > 0) else 1.0
+            width = unit if np.allclose(e / unit, np.rint(e / unit)) else pool.max_loss() / 10000
+        dist = LossDistribution(width)
+    if chunk is None: chunk = min(100000, max(1, 1000000 // len(pool.pd)))
+    rng = np.random.default_rng(seed)
+    while N > 0:
+        n = min(N, chunk)
+        dist.update(pool.losses(rng, n))
+        N -= n
+    return dist
+
+
+def large_pool_quantile(pd, rho, alpha=0.999):
+    """ the alpha quantile of the default rate of an infinitely granular pool
+
+        N( (N^-1(pd) + rho N^-1(alpha)) / sqrt(1-rho^2) )
+    """
+    return float(ndtr((ndtri(pd) + rho * ndtri(alpha)) / sqrt(1.0 - rho * rho)))
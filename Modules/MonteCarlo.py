@@ -0,0 +1,215 @@
+"""
+Parallel Monte Carlo Driver
+
+
+splits the generation of Monte Carlo paths, and the evaluation of the payoff
+on those paths, across a pool of worker processes
+
+simulate - runs a simulation task on a process pool, and merges the results
+EuropeanTask - terminal value of a lognormal forward, with a payoff applied
+CorrelatedTask - correlated normals (using a Cholesky decomposition)
+LargePoolTask - number of defaults in a large homogeneous one-factor pool
+
+every worker gets its own random number stream, spawned from one
+numpy.random.SeedSequence, and the number of paths per worker, the batches
+within a worker and the order in which the workers' results are merged only
+depend on N, seed and workers; the results are therefore bit-identical for
+a given seed and worker count (but NOT across different worker counts)
+
+a task is any picklable callable task(rng, n) that draws n paths from the
+numpy Generator rng and returns an array with one value (or one row of
+values) per path; note that with the spawn start method the tasks must be
+importable by the workers, ie not be defined in a notebook
+
+
+DEPENDENCIES
+
+numpy
+scipy
+concurrent.futures
+
+
+AUTHOR AND COPYRIGHT
+
+Copyright (c) 2014
+Stefan LOESCH, oditorium
+http://www.oditorium.com
+
+
+IMPORTANT LEGAL INFORMATION
+
+This software is distributed WITHOUT ANY WARRANTY and without even the
+implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE,
+and it does NOT CONSTITUTE INVESTMENT ADVICE. It shall not be used for
+other than academic purposes, and in particular IT SHOULD NOT BE RELIED
+UPON TO PRICE OR RISK MANAGE ACTUAL PORTFOLIOS.
+
+This software is licensed under the Gnu AGPL v3.0. See the LICENSE file
+or see http://www.gnu.org/licenses/
+
+"""
+
+__version__ = "0.1a"
+
+#-----------------------------------------------------------------------------
+#  Copyright (c) 2014  Stefan LOESCH, oditorium
+#
+#  Distributed under the terms of the AGPL License.
+#
+#  The full license is in the file LICENSE, distributed with this software.
+#-----------------------------------------------------------------------------
+
+import os
+from math import sqrt
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from scipy.special import ndtri
+
+
+def _combine(a, b):
+    """ combines two partial results (n, mean, m2) into one
+
+    uses the pairwise update of Chan et al, where m2 is the sum of squared
+    deviations from the mean
+    """
+    na, meana, m2a = a
+    nb, meanb, m2b = b
+    if na == 0: return b
+    if nb == 0: return a
+    n = na + nb
+    delta = meanb - meana
+    mean = meana + delta * nb / n
+    m2 = m2a + m2b + delta * delta * na * nb / n
+    return n, mean, m2
+
+
+def _worker(task, seedseq, n, batch):
+    """ runs n paths of task on the stream seedseq, in batches of size batch
+
+    returns the partial result (n, mean, m2)
+    """
+    rng = np.random.default_rng(seedseq)
+    res = (0, 0.0, 0.0)
+    while n > 0:
+        m = min(n, batch)
+        x = np.asarray(task(rng, m), dtype=float)
+        mean = np.mean(x, axis=0)
+        res = _combine(res, (m, mean, np.sum((x - mean)**2, axis=0)))
+        n -= m
+    return res
+
+
+def simulate(task, N, seed=None, workers=None, batch=100000):
+    """ runs a Monte Carlo simulation of task on a process pool
+
+    PARAMETERS
+        task - the task to be simulated (see the module docstring)
+        N - the total number of paths (at least 2, for the standard error)
+        seed - the seed from which the worker streams are spawned; must be
+                given for the results to be reproducible
+        workers - number of worker processes (default: number of cpus); for
+                workers == 1 the simulation is run in-process
+        batch - max number of paths generated in one go within a worker
+
+    RETURNS
+        (estimate, stderr)
+
+        estimate - the mean of the task values over all paths
+        stderr - the standard error of the estimate
+    """
+    if N < 2: raise ValueError("at least 2 paths are needed, got N=%s" % N)
+    if workers is None: workers = os.cpu_count() or 1
+    seeds = np.random.SeedSequence(seed).spawn(workers)
+    sizes = [N // workers + (1 if i < N % workers else 0) for i in range(workers)]
+
+    if workers == 1:
+        results = [_worker(task, seeds[0], sizes[0], batch)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_worker, [task]*workers, seeds, sizes, [batch]*workers))
+
+    res = (0, 0.0, 0.0)
+    for r in results: res = _combine(res, r)
+    n, mean, m2 = res
+    stderr = np.sqrt(m2 / (n - 1) / n)
+    if np.ndim(mean) == 0: return float(mean), float(stderr)
+    return mean, stderr
+
+
+class EuropeanTask:
+    """ terminal value of a lognormal forward, with a payoff applied
+
+        F_T = F exp( -0.5 sig^2 T + sig sqrt(T) Z )
+
+    PARAMETERS
+        fwd - the forward
+        sig - the volatility
+        mat - time to maturity (in years)
+        payoff - vectorised payoff function (eg OptionPricing.payoff_call)
+        antithetic - if True, every path is the average over Z and -Z
+
+    the mean of the task is the forward value of the option
+    """
+
+    def __init__(self, fwd, sig, mat, payoff, antithetic=True):
+        self.fwd = float(fwd)
+        self.sig = float(sig)
+        self.mat = float(mat)
+        self.payoff = payoff
+        self.antithetic = antithetic
+
+    def __call__(self, rng, n):
+        z = rng.standard_normal(n)
+        drift = -0.5 * self.sig * self.sig * self.mat
+        vol = self.sig * sqrt(self.mat)
+        po = self.payoff(self.fwd * np.exp(drift + vol * z))
+        if self.antithetic:
+            po = 0.5 * (po + self.payoff(self.fwd * np.exp(drift - vol * z)))
+        return po
+
+
+class CorrelatedTask:
+    """ correlated normals, generated using a Cholesky decomposition
+
+    PARAMETERS
+        cov - the covariance matrix (d x d)
+        fn - function mapping an (n x d) array of correlated normals onto
+                the values of interest (default: the normals themselves)
+    """
+
+    def __init__(self, cov, fn=None):
+        self.m = np.linalg.cholesky(np.asarray(cov, dtype=float)).T
+        self.fn = fn
+
+    def __call__(self, rng, n):
+        x = np.dot(rng.standard_normal((n, self.m.shape[0])), self.m)
+        if self.fn is None: return x
+        return self.fn(x)
+
+
+class LargePoolTask:
+    """ number of defaults in a large homogeneous one-factor pool
+
+    name i defaults iff rho M + sqrt(1-rho^2) e_i < N^-1(pd), where M and e_i
+    are independent standard normals (same parametrisation as in the
+    MCRisk1-LargePoolCap notebook, but using the one-factor structure directly,
+    ie O(n d) per batch rather than a dense matrix product)
+
+    PARAMETERS
+        d - number of names in the pool
+        pd - default probability per name
+        rho - factor loading
+        lgd - loss given default per name (default 1, ie count defaults)
+    """
+
+    def __init__(self, d, pd, rho, lgd=1.0):
+        self.d = int(d)
+        self.threshold = float(ndtri(pd))
+        self.rho = float(rho)
+        self.lgd = float(lgd)
+
+    def __call__(self, rng, n):
+        m = rng.standard_normal((n, 1))
+        e = rng.standard_normal((n, self.d))
+        x = self.rho * m + sqrt(1.0 - self.rho * self.rho) * e
+        return self.lgd * np.count_nonzero(x < self.threshold, axis=1)
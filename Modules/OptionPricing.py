@@ -3,14 +3,39 @@ Option Pricing Library
 
 
 defines objects for pricing and risk managing financial derivatives
-whilst framework is generic, a Black-Scholes type environment is assumed
-(eg, no term structure of rates, volatilities etc)
+whilst framework is generic, a Black-Scholes type environment is assumed;
+rates, yields and vols are flat unless given as term structures (Curve,
+VolCurve), which are then resolved to their average to maturity
 
 the base object mostly defines how to compute risk parameters, and
 the actual calculations are then executed in derived classes; those
-calculations are currently done using analytical formulas, but in
-principle other valuation methods (Monte Carlo, PDE) could also be
-implemented
+calculations are mostly done using analytical formulas, but other
+valuation methods can be implemented as well; MCEuropean values
+European options with arbitrary payoffs using Monte Carlo, and PDEPricing
+values European and American options with arbitrary payoffs using a
+Crank-Nicolson finite difference scheme
+
+the Black-Scholes objects accept numpy arrays instead of floats for all
+of their numerical parameters (mat, strike, rate, yld, sig, spot, time);
+those are broadcast against each other, so that a whole book of options
+can be priced in one call, eg
+
+    BSCall(mat=1, strike=[90,100,110], spot=100, sig=0.2).PV()
+
+scalar parameters continue to yield scalar results
+
+rate and yld can be given as Curve, and sig as VolCurve, eg
+
+    rc = Curve([1, 2, 5], [0.02, 0.03, 0.035])
+    BSCall(mat=[1,3,7], strike=100, spot=100, rate=rc, sig=0.2).PV()
+
+the Rho and Vega of those are parallel shifts of the curves, and RhoBuckets
+and VegaBuckets return the sensitivities to the individual buckets; gradient
+returns the derivatives of PV with respect to all inputs (including every
+curve bucket) in one reverse mode (adjoint) sweep
+
+to see where the time goes, instrument() counts the PV, FV, d12 etc calls
+made by every top level Greek, per class, and times the top level calls
 
 VERSION
 
@@ -45,8 +70,418 @@ or see http://www.gnu.org/licenses/
 #  The full license is in the file LICENSE, distributed with this software.
 #-----------------------------------------------------------------------------
 
-from math import exp,log,sqrt
-from scipy.stats import norm
+from math import exp,log,sqrt,erfc,pi
+from bisect import bisect_left
+from functools import partial, wraps
+from copy import copy
+from time import perf_counter
+from contextlib import contextmanager
+import importlib
+
+
+class _LazyModule:
+    """
+    
+    placeholder for a module that is only imported when one of its attributes
+    is first accessed (at which point it replaces itself in the module globals)
+    
+    numpy and scipy take hundreds of milliseconds to import, but scalar pricing
+    only needs math; so importing this module stays cheap, and the numerical
+    backend is loaded when the first array, Monte Carlo or PDE calculation
+    needs it
+    
+    """
+    
+    def __init__(self, name, alias):
+        self._name = name
+        self._alias = alias
+    
+    def __getattr__(self, attr):
+        module = importlib.import_module(self._name)
+        globals()[self._alias] = module
+        return getattr(module, attr)
+
+np = _LazyModule("numpy", "np")
+_special = _LazyModule("scipy.special", "_special")
+_linalg = _LazyModule("scipy.linalg", "_linalg")
+_qrandom = _LazyModule("QuasiRandom", "_qrandom")
+
+
+def _float(x):
+    """
+    
+    converts a parameter to float; array-like parameters are converted to
+    float arrays instead (None and curves are passed through)
+    
+    """
+    if x is None: return None
+    if isinstance(x, (int, float)): return float(x)
+    if isinstance(x, Curve): return x
+    return np.asarray(x, dtype=float)
+
+# elementary functions using math for scalars and numpy for arrays
+def _exp(x):
+    if isinstance(x, (int, float)): return exp(x)
+    if isinstance(x, _Adjoint): return x._exp()
+    return np.exp(x)
+
+def _log(x):
+    if isinstance(x, (int, float)): return log(x)
+    if isinstance(x, _Adjoint): return x._log()
+    return np.log(x)
+
+def _sqrt(x):
+    if isinstance(x, (int, float)): return sqrt(x)
+    if isinstance(x, _Adjoint): return x._sqrt()
+    return np.sqrt(x)
+
+# the normal distribution: scipy.stats.norm goes through the generic
+# distribution machinery which costs much more than the arithmetic around
+# it, so we use erfc for scalars and the ufunc ndtr for arrays instead
+_SQRT2 = sqrt(2.0)
+_SQRT2PI = sqrt(2.0*pi)
+
+def _ncdf(x):
+    if isinstance(x, (int, float)): return 0.5 * erfc(-x / _SQRT2)
+    if isinstance(x, _Adjoint): return x._ncdf()
+    return _special.ndtr(x)
+
+def _npdf(x):
+    if isinstance(x, (int, float)): return exp(-0.5*x*x) / _SQRT2PI
+    if isinstance(x, _Adjoint): return x._npdf()
+    return np.exp(-0.5*x*x) / _SQRT2PI
+
+def _ladder_chunk(option, greeks, chunk):
+    """
+    
+    evaluates one chunk of OptionPricing.ladder cells; chunk is a list of
+    (cell, spot, sig, time), and the result a list of (cell, {greek: value})
+    
+    """
+    res = []
+    for cell, spot, sig, time in chunk:
+        if greeks == ('PV',): v = {'PV': option.PV(spot=spot, sig=sig, time=time)}
+        else: v = option.risk(spot=spot, sig=sig, time=time)
+        res.append((cell, v))
+    return res
+
+def _df(mat, rate, time):
+    """discount factor exp(-rate (mat-time)); also used for fdf"""
+    return _exp(-rate * (mat - time))
+
+
+class Curve:
+    """
+    
+    term structure of a continuously compounded rate (or yield), given as
+    piecewise flat instantaneous (forward) rates
+    
+    PARAMETERS
+        times - the pillar times t_1 < ... < t_n (in years)
+        values - the instantaneous rates, values[i] applying on (t_{i-1}, t_i]
+                    (with t_0 = 0); the last value is extrapolated flat
+    
+    a curve can be given instead of a float for rate and yld (and a VolCurve
+    for sig) in all OptionPricing classes except PDEPricing; it is resolved
+    to the average rate between time and maturity
+    
+        average(t, T) = 1/(T-t) int_t^T r(u) du
+    
+    the integrals up to the pillars are computed once on construction, so
+    that every average is a binary search plus a few operations (and works
+    on arrays of times, eg for a book with many maturities)
+    
+    curves are immutable; `curve + x` returns a copy with all values shifted
+    by x, so the existing Rho/Vega bumps (rate+0.01, sig+0.01) are parallel
+    shifts of the whole curve, and `bucket(i, x)` shifts only bucket i
+    
+    """
+    
+    def __init__(self, times, values):
+        
+        self.times = tuple(float(t) for t in times)
+        self.values = tuple(float(v) for v in values)
+        if len(self.times) != len(self.values) or not self.times:
+            raise ValueError("times and values must be non-empty and of the same length")
+        if any(t1 <= t0 for t0, t1 in zip((0.0,) + self.times, self.times)):
+            raise ValueError("times must be positive and increasing")
+        self._start = (0.0,) + self.times[:-1]
+        f = self._integrand(self.values)
+        cum = [0.0]
+        for t0, t1, x in zip(self._start, self.times, f): cum.append(cum[-1] + x * (t1 - t0))
+        self._f = f
+        self._cum = tuple(cum[:-1])
+        self._arrays = None
+    
+    def _integrand(self, values):
+        return values
+    
+    def _mean(self, x):
+        return x
+    
+    def __repr__(self):
+        return "%s(%r, %r)" % (self.__class__.__name__, self.times, self.values)
+    
+    def __add__(self, x):
+        if not isinstance(x, (int, float)): return NotImplemented
+        return self.__class__(self.times, [v + x for v in self.values])
+    
+    __radd__ = __add__
+    
+    def __sub__(self, x):
+        if not isinstance(x, (int, float)): return NotImplemented
+        return self + (-x)
+    
+    def bucket(self, i, x):
+        """
+        
+        returns a copy of the curve with only the value of bucket i shifted by x
+        
+        """
+        values = list(self.values)
+        values[i] += x
+        return self.__class__(self.times, values)
+    
+    def _index(self, t):
+        """the bucket containing t (the last bucket for t beyond the last pillar)"""
+        if isinstance(t, (int, float)): return min(bisect_left(self.times, t), len(self.times) - 1)
+        if self._arrays is None:
+            self._arrays = tuple(np.array(a) for a in (self.times, self._start, self._f, self._cum))
+        return np.minimum(np.searchsorted(self._arrays[0], t), len(self.times) - 1)
+    
+    def integral(self, t):
+        """
+        
+        the integral of the instantaneous rate (for a VolCurve: variance) from 0 to t
+        
+        """
+        i = self._index(t)
+        if isinstance(t, (int, float)): return self._cum[i] + self._f[i] * (t - self._start[i])
+        times, start, f, cum = self._arrays
+        return cum[i] + f[i] * (t - start[i])
+    
+    def instantaneous(self, t):
+        """
+        
+        the instantaneous value at t
+        
+        """
+        i = self._index(t)
+        if isinstance(t, (int, float)): return self.values[i]
+        return np.array(self.values)[i]
+    
+    def average(self, t0, t1):
+        """
+        
+        the average value between t0 and t1, ie the flat value that is
+        equivalent to the curve over that period (the instantaneous value
+        at t0 if t0 == t1)
+        
+        """
+        if isinstance(t0, (int, float)) and isinstance(t1, (int, float)):
+            if t1 == t0: return self.instantaneous(t0)
+            return self._mean((self.integral(t1) - self.integral(t0)) / (t1 - t0))
+        t0, t1 = np.asarray(t0, dtype=float), np.asarray(t1, dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            avg = self._mean((self.integral(t1) - self.integral(t0)) / (t1 - t0))
+        return np.where(t1 == t0, self.instantaneous(t0), avg)
+    
+    def weights(self, t0, t1):
+        """
+        
+        the weight of every bucket in the average between t0 and t1, ie its
+        overlap with [t0, t1] divided by t1 - t0, as array with the buckets
+        along the first axis (for t0 == t1: 1 for the bucket containing t0)
+        
+        """
+        t0, t1 = np.asarray(t0, dtype=float), np.asarray(t1, dtype=float)
+        n = len(self.times)
+        col = (n,) + (1,) * np.ndim(np.broadcast(t0, t1))
+        end = np.array(self.times[:-1] + (np.inf,)).reshape(col)
+        start = np.array((-np.inf,) + self._start[1:]).reshape(col)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            w = np.maximum(np.minimum(t1, end) - np.maximum(t0, start), 0.0) / (t1 - t0)
+        return np.where(t1 == t0, np.arange(n).reshape(col) == self._index(t0), w)
+    
+    def bucket_averages(self, t0, t1, x):
+        """
+        
+        the averages between t0 and t1 for all the bucket shifted curves
+        (bucket(i, x) for all i) in one go, as array with the buckets along
+        the first axis
+        
+        """
+        w = self.weights(t0, t1)
+        v = np.array(self.values).reshape(w.shape[:1] + (1,) * (w.ndim - 1))
+        m = np.sum(self._integrand(v) * w, axis=0)
+        return self._mean(m + (self._integrand(v + x) - self._integrand(v)) * w)
+    
+    def _dintegrand(self, values):
+        return 1.0
+    
+    def _adjoint_average(self, t0, t1, leaves):
+        """
+        
+        the average between t0 and t1 as _Adjoint node, whose inputs are the
+        bucket values `leaves` (a list of _Adjoint), and t0 and t1 if those are
+        _Adjoint themselves (see OptionPricing.gradient)
+        
+        """
+        a0, a1 = _value(t0), _value(t1)
+        w = self.weights(a0, a1)
+        v = np.array(self.values).reshape(w.shape[:1] + (1,) * (w.ndim - 1))
+        m = np.sum(self._integrand(v) * w, axis=0)
+        dm = self._dintegrand(v) * w
+        parents = [(leaf, dm[i]) for i, leaf in enumerate(leaves)]
+        # d/dt1 int_t0^t1 f / (t1-t0) = (f(t1) - m) / (t1-t0), and likewise for t0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if isinstance(t0, _Adjoint):
+                parents.append((t0, np.where(a1 == a0, 0.0, (m - self._integrand(self.instantaneous(a0))) / (a1 - a0))))
+            if isinstance(t1, _Adjoint):
+                parents.append((t1, np.where(a1 == a0, 0.0, (self._integrand(self.instantaneous(a1)) - m) / (a1 - a0))))
+        if m.ndim == 0: m, parents = float(m), [(p, float(d)) for p, d in parents]
+        return self._mean(_Adjoint(leaves[0].tape, m, tuple(parents)))
+
+
+class VolCurve(Curve):
+    """
+    
+    term structure of volatility, given as piecewise flat instantaneous vols
+    (see Curve); the integrals are those of the variance, so that the
+    average between t and T is the implied (Black-Scholes) vol
+    
+        average(t, T) = sqrt( 1/(T-t) int_t^T sig(u)^2 du )
+    
+    """
+    
+    def _integrand(self, values):
+        if isinstance(values, tuple): return tuple(v*v for v in values)
+        return values * values
+    
+    def _dintegrand(self, values):
+        return 2.0 * values
+    
+    def _mean(self, x):
+        return _sqrt(x)
+
+
+def _effective(x, time, mat):
+    """resolves a Curve to its average between time and mat (floats are returned as they are)"""
+    if isinstance(x, Curve): return x.average(time, mat)
+    return x
+
+def _instantaneous(x, time):
+    """resolves a Curve to its instantaneous value at time"""
+    if isinstance(x, Curve): return x.instantaneous(time)
+    return x
+
+
+class _Adjoint:
+    """
+    
+    a number (float or array) that records how it was computed, so that the
+    derivatives of a result with respect to all of its inputs can be obtained
+    in one reverse sweep (see OptionPricing.gradient)
+    
+    every node holds its value and its parents, ie the nodes it was computed
+    from together with the local derivatives with respect to them, and is
+    appended to the tape (a list shared by all nodes of one calculation);
+    the arithmetic operators and the elementary functions of this module
+    (_exp, _log, _sqrt, _ncdf, _npdf) create new nodes
+    
+    """
+    
+    __slots__ = ('tape', 'value', 'parents', 'grad')
+    __hash__ = None # not hashable, so that the df/d12 cache is bypassed
+    __array_ufunc__ = None # numpy arrays defer to the reflected operators
+    
+    def __init__(self, tape, value, parents=()):
+        self.tape = tape
+        self.value = value
+        self.parents = parents
+        self.grad = None
+        tape.append(self)
+    
+    def __add__(self, x):
+        if isinstance(x, _Adjoint): return _Adjoint(self.tape, self.value + x.value, ((self, 1.0), (x, 1.0)))
+        return _Adjoint(self.tape, self.value + x, ((self, 1.0),))
+    
+    __radd__ = __add__
+    
+    def __sub__(self, x):
+        if isinstance(x, _Adjoint): return _Adjoint(self.tape, self.value - x.value, ((self, 1.0), (x, -1.0)))
+        return _Adjoint(self.tape, self.value - x, ((self, 1.0),))
+    
+    def __rsub__(self, x):
+        return _Adjoint(self.tape, x - self.value, ((self, -1.0),))
+    
+    def __mul__(self, x):
+        if isinstance(x, _Adjoint): return _Adjoint(self.tape, self.value * x.value, ((self, x.value), (x, self.value)))
+        return _Adjoint(self.tape, self.value * x, ((self, x),))
+    
+    __rmul__ = __mul__
+    
+    def __truediv__(self, x):
+        if isinstance(x, _Adjoint):
+            q = self.value / x.value
+            return _Adjoint(self.tape, q, ((self, 1.0 / x.value), (x, -q / x.value)))
+        return _Adjoint(self.tape, self.value / x, ((self, 1.0 / x),))
+    
+    def __rtruediv__(self, x):
+        q = x / self.value
+        return _Adjoint(self.tape, q, ((self, -q / self.value),))
+    
+    def __neg__(self):
+        return _Adjoint(self.tape, -self.value, ((self, -1.0),))
+    
+    def _exp(self):
+        v = _exp(self.value)
+        return _Adjoint(self.tape, v, ((self, v),))
+    
+    def _log(self):
+        return _Adjoint(self.tape, _log(self.value), ((self, 1.0 / self.value),))
+    
+    def _sqrt(self):
+        v = _sqrt(self.value)
+        return _Adjoint(self.tape, v, ((self, 0.5 / v),))
+    
+    def _ncdf(self):
+        return _Adjoint(self.tape, _ncdf(self.value), ((self, _npdf(self.value)),))
+    
+    def _npdf(self):
+        v = _npdf(self.value)
+        return _Adjoint(self.tape, v, ((self, -self.value * v),))
+
+def _value(x):
+    """the value of an _Adjoint (other objects are returned as they are)"""
+    if isinstance(x, _Adjoint): return x.value
+    return x
+
+def _unbroadcast(g, value):
+    """sums the gradient g over the axes along which value was broadcast"""
+    if isinstance(g, float) or np.shape(g) == np.shape(value): return g
+    shape = np.shape(value)
+    g = np.sum(g, axis=tuple(range(np.ndim(g) - len(shape))))
+    g = np.sum(g, axis=tuple(i for i, n in enumerate(shape) if n == 1), keepdims=True)
+    if shape == (): return float(g)
+    return g
+
+def _backward(result):
+    """
+    
+    reverse sweep: sets the `grad` of every node on the tape of result to
+    the derivative of result (summed over its elements) with respect to it
+    
+    """
+    result.grad = 1.0 if isinstance(result.value, float) else np.ones_like(result.value)
+    for node in reversed(result.tape):
+        g = node.grad
+        if g is None: continue
+        for p, d in node.parents:
+            dg = g * d
+            if not isinstance(dg, float): dg = _unbroadcast(dg, p.value)
+            p.grad = dg if p.grad is None else p.grad + dg
+
 
 class OptionPricing:
     """
@@ -60,27 +495,105 @@ class OptionPricing:
         yld - dividend yield or foreign discount factor (continous compounding)
         time - current time (in years; default = 0.0)
     
+    all parameters can also be given as numpy arrays (or lists) in which
+    case they are broadcast against each other and all results are arrays
+    
+    GREEKS
+        the Greeks are computed by bumping the inputs and revaluing, unless
+        `analytic` is True in which case they are computed in closed form
+        from the derivatives returned by `FVGreeks`; derived classes that
+        implement `FVGreeks` set `analytic = True`, and setting it to False
+        on an instance switches back to bump-and-revalue
+    
+    CACHING
+        if `cachesize` is set (on the class or an instance), df, fdf, ff and
+        d12 are memoised on their effective (scalar) inputs in a per-instance
+        cache bounded to that many entries, which is cleared whenever a public
+        attribute (eg spot, sig) is reassigned; cache_stats() returns the hit
+        and miss counters, and array valued calls bypass the cache
+        
+        the cache is off by default: with the erfc based normal kernel the
+        functions it memoises cost about as much as building and hashing the
+        keys, so for the scalar Black-Scholes classes it does not pay off; it
+        is meant for derived classes where these functions are expensive
+    
     """
     
     _version = "0.1a"
     
     _dSpc = 0.01 # perturbation for computing Delta, Gamma (percent)
     
+    analytic = False # compute the Greeks from FVGreeks rather than by bumping
+    
+    vectorised = False # the class can be priced with array valued parameters
+    
+    adjoint = False # PV can be differentiated in reverse mode (see gradient)
+    
+    cachesize = 0 # max number of entries in the df/fdf/ff/d12 cache (0 = off)
+    
     def __init__(self, mat=None, rate=None, yld=None, sig=None, spot=None, time=None):
         
-        if time == None: time = 0.0
-        if rate == None: rate = 0.0
-        if yld == None: yld = 0.0
-        if sig == None: sig = 0.00001
-        
-        self.mat = float(mat)
-        self.time = float(time)
-        self.rate = float(rate)
-        self.yld = float(yld)
-        self.sig = float(sig)
-        self.spot = float(spot)
+        if time is None: time = 0.0
+        if rate is None: rate = 0.0
+        if yld is None: yld = 0.0
+        if sig is None: sig = 0.00001
+        
+        self.mat = _float(mat)
+        self.time = _float(time)
+        self.rate = _float(rate)
+        self.yld = _float(yld)
+        self.sig = _float(sig)
+        self.spot = _float(spot)
+        self._cachecount = [0, 0] # hits, misses
         return
     
+    def __setattr__(self, name, value):
+        
+        if name[0] != "_": self._invalidate(name)
+        object.__setattr__(self, name, value)
+    
+    def _invalidate(self, name):
+        """
+        
+        called whenever the public attribute `name` is (re)assigned; clears the
+        cache (derived classes can extend this to drop their own cached state)
+        
+        """
+        self.__dict__.pop("_cache", None)
+    
+    def _memo(self, key, fn, *args):
+        """
+        
+        returns fn(*args), memoised under key in the instance cache; keys that
+        are not hashable (ie that contain arrays) are not cached; the callers
+        check `cachesize` themselves, so that there is no overhead when off
+        
+        """
+        d = self.__dict__
+        cache = d.get("_cache")
+        if cache is None: cache = d["_cache"] = {}
+        try:
+            value = cache[key]
+            d["_cachecount"][0] += 1
+            return value
+        except KeyError:
+            pass
+        except TypeError:
+            return fn(*args)
+        d["_cachecount"][1] += 1
+        value = cache[key] = fn(*args)
+        if len(cache) > self.cachesize: del cache[next(iter(cache))]
+        return value
+    
+    def cache_stats(self):
+        """
+        
+        returns the cache counters as dict (hits, misses, size)
+        
+        """
+        hits, misses = self._cachecount
+        return {'hits': hits, 'misses': misses, 'size': len(self.__dict__.get("_cache", ()))}
+    
     def FV(self, fwd, sig, time=0.0):
         """
         
@@ -93,6 +606,48 @@ class OptionPricing:
         
         """
         return 1.0
+    
+    
+    def FVGreeks(self, fwd, sig, time=None):
+        """
+        
+        the forward value of the option together with its derivatives with
+        respect to the forward and the volatility, returned as a tuple
+        
+            (FV, dFV/dF, d^2FV/dF^2, dFV/dsig, d^2FV/dsig^2, d^2FV/dF dsig)
+        
+        NOTE: this method is not implemented here; derived classes that have
+        closed form derivatives implement it and set `analytic = True`
+        
+        """
+        raise NotImplementedError("no analytic Greeks for %s" % self.__class__.__name__)
+    
+    
+    def _analytic(self, spot=None, time=None, rate=None, yld=None, sig=None):
+        """
+        
+        evaluates FVGreeks once for the given parameters, and returns it
+        together with the quantities needed to turn it into Greeks
+        
+            (df, ff, fwd, tau, sig, rate, yld, sigi, fvgreeks)
+        
+        where sig is the effective vol to maturity, and rate, yld and sigi
+        are the instantaneous rate, yield and vol at time (for flat
+        parameters they are all the same as the inputs)
+        
+        """
+        if spot is None: spot = self.spot 
+        if sig is None: sig = self.sig 
+        if time is None: time = self.time
+        if rate is None: rate = self.rate
+        if yld is None: yld = self.yld
+        df = self.df(rate=rate, time=time)
+        ff = self.ff(rate=rate, yld=yld, time=time)
+        fwd = ff*spot
+        sige = _effective(sig, time, self.mat)
+        g = self.FVGreeks(fwd=fwd, sig=sige, time=time)
+        return (df, ff, fwd, self.mat-time, sige, _instantaneous(rate, time),
+                    _instantaneous(yld, time), _instantaneous(sig, time), g)
   
     
     def df(self, mat=None, rate=None, time=None):
@@ -103,10 +658,12 @@ class OptionPricing:
             df = exp(-r (T-t) )
         
         """
-        if rate == None: rate = self.rate
-        if time == None: time = self.time
-        if mat == None: mat = self.mat
-        return exp(-rate * (mat - time))
+        if rate is None: rate = self.rate
+        if time is None: time = self.time
+        if mat is None: mat = self.mat
+        rate = _effective(rate, time, mat)
+        if self.cachesize: return self._memo(('df', mat, rate, time), _df, mat, rate, time)
+        return _exp(-rate * (mat - time))
    
     
     def fdf(self, mat=None, yld=None, time=None):
@@ -118,10 +675,12 @@ class OptionPricing:
             df = exp(-yld (T-t) )
         
         """
-        if yld == None: yld = self.yld
-        if time == None: time = self.time
-        if mat == None: mat = self.mat
-        return exp(-yld * (mat - time))
+        if yld is None: yld = self.yld
+        if time is None: time = self.time
+        if mat is None: mat = self.mat
+        yld = _effective(yld, time, mat)
+        if self.cachesize: return self._memo(('fdf', mat, yld, time), _df, mat, yld, time)
+        return _exp(-yld * (mat - time))
     
     
     def ff(self, mat=None, rate=None, yld=None, time=None):
@@ -132,6 +691,16 @@ class OptionPricing:
             ff = exp( -(rate-yld) * (T-t) ) = df / fdf
         
         """
+        if self.cachesize:
+            if rate is None: rate = self.rate
+            if yld is None: yld = self.yld
+            if time is None: time = self.time
+            if mat is None: mat = self.mat
+            return self._memo(('ff', mat, rate, yld, time), self._ff, mat, rate, yld, time)
+        return self._ff(mat, rate, yld, time)
+    
+    def _ff(self, mat, rate, yld, time):
+        
         return self.fdf(mat=mat, yld=yld, time=time) / self.df(mat=mat, rate=rate, time=time)
     
     
@@ -143,7 +712,7 @@ class OptionPricing:
             forward = ff * spot
         
         """
-        if spot == None: spot = self.spot
+        if spot is None: spot = self.spot
         return spot * self.ff(rate=rate, yld=yld, time=time, mat=mat)
         
     def PV(self, spot=None, time=None, rate=None, yld=None, sig=None):
@@ -154,8 +723,8 @@ class OptionPricing:
             PV = df FV
             
         """
-        if spot == None: spot = self.spot 
-        if sig == None: sig = self.sig 
+        if spot is None: spot = self.spot 
+        if sig is None: sig = self.sig 
         df = self.df(rate=rate, time=time)
         ff = self.ff(rate=rate, yld=yld, time=time)
         return df * self.FV(fwd = ff*spot, sig=sig, time=time)
@@ -170,7 +739,11 @@ class OptionPricing:
             Delta = dPV / dS
         
         """
-        if spot == None: spot = self.spot 
+        if self.analytic:
+            df, ff, fwd, tau, sig, rate, yld, sigi, g = self._analytic(spot, time, rate, yld, sig)
+            return df * ff * g[1]
+        
+        if spot is None: spot = self.spot 
         dS = self._dSpc * spot
         pvp = self.PV(spot=spot+dS, time=time, rate=rate, yld=yld, sig=sig)
         pvm = self.PV(spot=spot-dS, time=time, rate=rate, yld=yld, sig=sig)
@@ -185,7 +758,7 @@ class OptionPricing:
             DeltaCash = Delta x Spot
         
         """
-        if spot == None: spot = self.spot 
+        if spot is None: spot = self.spot 
         return spot * self.Delta(spot=spot, time=time, rate=rate, yld=yld, sig=sig)
 
     
@@ -198,7 +771,12 @@ class OptionPricing:
             Delta = dFV / dF
         
         """
-        if fwd == None: fwd = self.Forward(rate=rate, yld=yld, time=time) 
+        if fwd is None: fwd = self.Forward(rate=rate, yld=yld, time=time) 
+        if self.analytic:
+            if sig is None: sig = self.sig
+            sig = _effective(sig, self.time if time is None else time, self.mat)
+            return self.FVGreeks(fwd=fwd, sig=sig, time=time)[1]
+        
         dF = self._dSpc * fwd
         fvp = self.FV(fwd=fwd+dF)
         fvm = self.FV(fwd=fwd-dF)
@@ -213,7 +791,7 @@ class OptionPricing:
             DeltaFwdCash = DeltaForward x Forward
         
         """
-        if fwd == None: fwd = self.Forward(rate=rate, yld=yld, time=time) 
+        if fwd is None: fwd = self.Forward(rate=rate, yld=yld, time=time) 
         return fwd * self.DeltaFwd(fwd=fwd, time=time, rate=rate, yld=yld, sig=sig)
  
     
@@ -226,7 +804,11 @@ class OptionPricing:
             Gamma = d^2PV / dS^2
         
         """
-        if spot == None: spot = self.spot 
+        if self.analytic:
+            df, ff, fwd, tau, sig, rate, yld, sigi, g = self._analytic(spot, time, rate, yld, sig)
+            return df * ff * ff * g[2]
+        
+        if spot is None: spot = self.spot 
         dS = self._dSpc * spot
         pvp = self.PV(spot=spot+dS, time=time, rate=rate, yld=yld, sig=sig)
         pvm = self.PV(spot=spot-dS, time=time, rate=rate, yld=yld, sig=sig)
@@ -246,7 +828,7 @@ class OptionPricing:
             ... + 0.5 * sig^2 * GammaCash + ... 
         
         """
-        if spot == None: spot = self.spot 
+        if spot is None: spot = self.spot 
         return spot*spot * self.Gamma(spot=spot, time=time, rate=rate, yld=yld, sig=sig)
     
     def Vega(self, spot=None, time=None, rate=None, yld=None, sig=None):
@@ -258,7 +840,11 @@ class OptionPricing:
             Vega = PV(sig + 0.01) - PV (sig)
         
         """
-        if sig == None: sig = self.sig
+        if self.analytic:
+            df, ff, fwd, tau, sig, rate, yld, sigi, g = self._analytic(spot, time, rate, yld, sig)
+            return 0.01 * df * g[3]
+        
+        if sig is None: sig = self.sig
         pvp = self.PV(sig=sig+0.01, spot=spot, time=time, rate=rate, yld=yld)
         pv = self.PV(sig=sig, spot=spot, time=time, rate=rate, yld=yld)
         return pvp - pv
@@ -273,7 +859,14 @@ class OptionPricing:
             Theta = PV(time + 1.0/365) - PV (time)
         
         """
-        if time == None: time = self.time
+        if self.analytic:
+            # dPV/dt = r PV - df (r-y) F dFV/dF - df sigi^2/(2 sig (T-t)) dFV/dsig
+            # (r, y and sigi instantaneous at t, sig the effective vol to maturity)
+            df, ff, fwd, tau, sig, rate, yld, sigi, g = self._analytic(spot, time, rate, yld, sig)
+            dpvdt = rate*df*g[0] - df*(rate-yld)*fwd*g[1] - df*sigi*sigi/(2.0*sig*tau)*g[3]
+            return 0.0027397260273972603 * dpvdt
+        
+        if time is None: time = self.time
         pvp = self.PV(time=time+0.0027397260273972603, spot=spot, rate=rate, yld=yld, sig=sig)
         pv = self.PV(time=time, spot=spot, rate=rate, yld=yld, sig=sig)
         return pvp - pv
@@ -288,7 +881,11 @@ class OptionPricing:
             Rho = d PV / d rate * 0.01
         
         """
-        if rate == None: rate = self.rate
+        if self.analytic:
+            df, ff, fwd, tau, sig, rate, yld, sigi, g = self._analytic(spot, time, rate, yld, sig)
+            return 0.01 * df * tau * (fwd*g[1] - g[0])
+        
+        if rate is None: rate = self.rate
         pvp = self.PV(time=time, spot=spot, rate=rate+0.01, yld=yld, sig=sig)
         pv = self.PV(time=time, spot=spot, rate=rate, yld=yld, sig=sig)
         return pvp - pv
@@ -303,7 +900,11 @@ class OptionPricing:
 
         
         """
-        if yld == None: yld = self.yld
+        if self.analytic:
+            df, ff, fwd, tau, sig, rate, yld, sigi, g = self._analytic(spot, time, rate, yld, sig)
+            return -0.01 * df * tau * fwd * g[1]
+        
+        if yld is None: yld = self.yld
         pvp = self.PV(time=time, spot=spot, rate=rate, yld=yld+0.01, sig=sig)
         pv = self.PV(time=time, spot=spot, rate=rate, yld=yld, sig=sig)
         return pvp - pv
@@ -317,8 +918,11 @@ class OptionPricing:
             Volga = d^2 PV / d sig^2 * 0.01^2
         
         """
+        if self.analytic:
+            df, ff, fwd, tau, sig, rate, yld, sigi, g = self._analytic(spot, time, rate, yld, sig)
+            return 0.0001 * df * g[4]
         
-        if sig == None: sig = self.sig 
+        if sig is None: sig = self.sig 
         pvp = self.PV(spot=spot, time=time, rate=rate, yld=yld, sig=sig+0.01)
         pvm = self.PV(spot=spot, time=time, rate=rate, yld=yld, sig=sig-0.01)
         pv = self.PV(spot=spot, time=time, rate=rate, yld=yld, sig=sig)
@@ -333,11 +937,248 @@ class OptionPricing:
             Vanna = d^2 PV / d sig dS
         
         """
-        if sig == None: sig = self.sig 
+        if self.analytic:
+            df, ff, fwd, tau, sig, rate, yld, sigi, g = self._analytic(spot, time, rate, yld, sig)
+            return df * ff * g[5]
+        
+        if sig is None: sig = self.sig 
         delp = self.Delta(spot=spot, time=time, rate=rate, yld=yld, sig=sig+0.01)
         delm = self.Delta(spot=spot, time=time, rate=rate, yld=yld, sig=sig-0.01)
-        return (delp - delm)/0.01
-        
+        return (delp - delm)/0.02
+
+    def risk(self, spot=None, time=None, rate=None, yld=None, sig=None):
+        """
+
+        computes PV and all Greeks in one go, and returns them as a dict
+
+            PV, Delta, DeltaCash, Gamma, GammaCash, Vega, Theta, Rho, RhoYld, Volga, Vanna
+
+        the values are the same as those returned by the individual methods,
+        but every perturbed scenario is only evaluated once (eg Delta and Gamma
+        share the PVs at spot +/- dS, and Vega, Volga and Vanna those at
+        sig +/- 0.01), and the discount and forward factors are only computed
+        once for all scenarios that do not move time or rates
+
+        """
+        if spot is None: spot = self.spot
+        if sig is None: sig = self.sig
+
+        if self.analytic:
+            df, ff, fwd, tau, sig, rate, yld, sigi, g = self._analytic(spot, time, rate, yld, sig)
+            pv = df * g[0]
+            delta = df * ff * g[1]
+            gamma = df * ff * ff * g[2]
+            vega = 0.01 * df * g[3]
+            theta = 0.0027397260273972603 * (rate*pv - df*(rate-yld)*fwd*g[1] - df*sigi*sigi/(2.0*sig*tau)*g[3])
+            rho = 0.01 * df * tau * (fwd*g[1] - g[0])
+            rhoyld = -0.01 * df * tau * fwd * g[1]
+            volga = 0.0001 * df * g[4]
+            vanna = df * ff * g[5]
+
+        else:
+            if time is None: time = self.time
+            if rate is None: rate = self.rate
+            if yld is None: yld = self.yld
+            df = self.df(rate=rate, time=time)
+            ff = self.ff(rate=rate, yld=yld, time=time)
+            def pvf(spot, sig): return df * self.FV(fwd=ff*spot, sig=sig, time=time)
+
+            dS = self._dSpc * spot
+            pv = pvf(spot, sig)
+            pvp, pvm = pvf(spot+dS, sig), pvf(spot-dS, sig)
+            pvsp, pvsm = pvf(spot, sig+0.01), pvf(spot, sig-0.01)
+            pvpsp, pvmsp = pvf(spot+dS, sig+0.01), pvf(spot-dS, sig+0.01)
+            pvpsm, pvmsm = pvf(spot+dS, sig-0.01), pvf(spot-dS, sig-0.01)
+            pvt = self.PV(time=time+0.0027397260273972603, spot=spot, rate=rate, yld=yld, sig=sig)
+            pvr = self.PV(time=time, spot=spot, rate=rate+0.01, yld=yld, sig=sig)
+            pvy = self.PV(time=time, spot=spot, rate=rate, yld=yld+0.01, sig=sig)
+
+            delta = (pvp - pvm) / (2.0 * dS)
+            gamma = (pvp + pvm - 2.0*pv) / (dS*dS)
+            vega = pvsp - pv
+            theta = pvt - pv
+            rho = pvr - pv
+            rhoyld = pvy - pv
+            volga = pvsp + pvsm - 2.0*pv
+            vanna = ((pvpsp - pvmsp) / (2.0 * dS) - (pvpsm - pvmsm) / (2.0 * dS))/0.02
+
+        return {
+            'PV': pv,
+            'Delta': delta,
+            'DeltaCash': spot * delta,
+            'Gamma': gamma,
+            'GammaCash': spot*spot * gamma,
+            'Vega': vega,
+            'Theta': theta,
+            'Rho': rho,
+            'RhoYld': rhoyld,
+            'Volga': volga,
+            'Vanna': vanna,
+        }
+
+    def ladder(self, dspot=(0.0,), dsig=(0.0,), dtime=(0.0,), greeks=None, chunksize=64, executor=None):
+        """
+
+        scenario ladder, ie PV (and optionally Greeks) on a grid of spot
+        shocks x vol shocks x time rolls
+
+            dspot - relative spot shocks, ie spot -> spot * (1 + dspot)
+            dsig - absolute vol shocks, ie sig -> sig + dsig
+            dtime - time rolls in years, ie time -> time + dtime
+            greeks - if None, only compute the PV; otherwise a list of keys
+                        of `risk` (eg ["PV", "Delta", "Gamma"])
+            chunksize, executor - see below
+
+        for classes that can be priced on arrays (`vectorised` is True) the
+        whole cube is computed in one broadcast call; for other classes the
+        cells are evaluated in chunks of chunksize, and if executor is given
+        (a concurrent.futures Executor, threads or processes) the chunks are
+        spread over it
+
+        RETURNS
+            array of shape (len(dspot), len(dsig), len(dtime)) + the shape of
+            the instance's own array parameters if greeks is None, otherwise
+            a dict greek -> such an array
+
+        """
+        dspot, dsig, dtime = (np.atleast_1d(np.asarray(x, dtype=float)) for x in (dspot, dsig, dtime))
+        cube = (len(dspot), len(dsig), len(dtime))
+
+        if self.vectorised:
+            ones = (1,) * np.ndim(np.broadcast(self.mat, self.rate, self.yld, self.sig,
+                                                self.spot, self.time, getattr(self, 'strike', 0.0)))
+            spot = self.spot * (1.0 + dspot.reshape((-1, 1, 1) + ones))
+            time = self.time + dtime.reshape((1, 1, -1) + ones)
+            sig = _effective(self.sig, time, self.mat) + dsig.reshape((1, -1, 1) + ones)
+            if greeks is None: res = {'PV': self.PV(spot=spot, sig=sig, time=time)}
+            else: res = self.risk(spot=spot, sig=sig, time=time)
+            shape = np.broadcast(spot, sig, time, res['PV']).shape
+            res = {g: np.broadcast_to(res[g], shape).copy() for g in (greeks or ('PV',))}
+
+        else:
+            # spot innermost: classes that cache a grid (PDEPricing) read all spot
+            # shocks of a vol and time off one solve
+            cells = [(i, j, k) for j in range(cube[1]) for k in range(cube[2]) for i in range(cube[0])]
+            chunks = [[(c, self.spot * (1.0 + dspot[c[0]]), self.sig + dsig[c[1]], self.time + dtime[c[2]])
+                        for c in cells[n:n+chunksize]] for n in range(0, len(cells), chunksize)]
+            keys = tuple(greeks or ('PV',))
+            mapper = map if executor is None else executor.map
+            res = {g: np.empty(cube) for g in keys}
+            for values in mapper(_ladder_chunk, [self]*len(chunks), [keys]*len(chunks), chunks):
+                for cell, v in values:
+                    for g in keys: res[g][cell] = v[g]
+
+        if greeks is None: return res['PV']
+        return res
+
+    def RhoBuckets(self, spot=None, time=None, rate=None, yld=None, sig=None):
+        """
+
+        the bucketed Rho, ie for every bucket of the rate curve the change in
+        PV if only that bucket is shifted by 1 point (rate must be a Curve);
+        the buckets are along the first axis of the result, and they add up
+        to Rho (up to second order terms)
+
+        """
+        return self._buckets('rate', spot, time, rate, yld, sig)
+
+    def VegaBuckets(self, spot=None, time=None, rate=None, yld=None, sig=None):
+        """
+
+        the bucketed Vega, ie for every bucket of the vol curve the change in
+        PV if only that bucket is shifted by 1 point (sig must be a VolCurve);
+        the buckets are along the first axis of the result
+
+        """
+        return self._buckets('sig', spot, time, rate, yld, sig)
+
+    def _buckets(self, name, spot, time, rate, yld, sig):
+        """
+
+        PV(curve `name` with one bucket shifted by 0.01) - PV for all buckets;
+        for vectorised classes all buckets are priced in one call, on the
+        averages of the shifted curves (Curve.bucket_averages), otherwise
+        one shifted curve at a time
+
+        """
+        params = {'spot': spot, 'time': time, 'rate': rate, 'yld': yld, 'sig': sig}
+        if params[name] is None: params[name] = getattr(self, name)
+        if params['time'] is None: params['time'] = self.time
+        curve = params[name]
+        if not isinstance(curve, Curve): raise TypeError("%s is not a Curve" % name)
+        pv = self.PV(**params)
+
+        if self.vectorised:
+            avg = curve.bucket_averages(params['time'], self.mat, 0.01)
+            ndim = np.ndim(np.broadcast(self.mat, self.rate, self.yld, self.sig, self.spot,
+                                        self.time, getattr(self, 'strike', 0.0), *params.values()))
+            params[name] = avg.reshape(avg.shape[:1] + (1,) * (ndim + 1 - avg.ndim) + avg.shape[1:])
+            return self.PV(**params) - pv
+
+        res = []
+        for i in range(len(curve.times)):
+            params[name] = curve.bucket(i, 0.01)
+            res.append(self.PV(**params) - pv)
+        return np.array(res)
+
+    def gradient(self, spot=None, time=None, rate=None, yld=None, sig=None):
+        """
+
+        the derivatives of PV with respect to all of its inputs, computed in
+        one reverse (adjoint) sweep through the PV calculation rather than by
+        bumping the inputs one at a time, returned as dict with the keys
+
+            spot, time, rate, yld, sig, mat (and strike if the class has one)
+
+        the values are plain partial derivatives, ie Delta is gradient['spot'],
+        and Vega, Rho and RhoYld are 0.01 times the entries for sig, rate and
+        yld (the bumped Greeks agree up to their finite difference error); for
+        parameters that are curves the entry is an array with the derivatives
+        with respect to every bucket value, ie all the bucketed Greeks at the
+        cost of one sweep
+
+        the sweep costs a fixed multiple (roughly 10x) of one PV, however many
+        inputs and curve buckets there are; so for flat parameters the closed
+        form Greeks (see risk) are cheaper, but for curves with many buckets
+        it replaces one revaluation per bucket
+
+        with array valued parameters, the entries are the derivatives of the
+        individual PVs with respect to their own inputs, summed over the
+        positions across which a parameter is broadcast (eg for a scalar spot
+        and an array of strikes, the total Delta)
+
+        NOTE: this requires `adjoint` to be True, ie that PV only uses arithmetic
+        and the elementary functions of this module (eg the BSBase classes)
+
+        """
+        if not self.adjoint: raise NotImplementedError("no adjoint mode for %s" % self.__class__.__name__)
+        params = {'spot': spot, 'time': time, 'rate': rate, 'yld': yld, 'sig': sig}
+        for k, v in params.items():
+            if v is None: params[k] = getattr(self, k)
+
+        opt = copy(self)
+        tape = []
+        leaves = {}
+        for k in ('mat', 'strike'):
+            if getattr(self, k, None) is not None:
+                leaves[k] = _Adjoint(tape, getattr(self, k))
+                setattr(opt, k, leaves[k])
+        leaves['spot'] = params['spot'] = _Adjoint(tape, params['spot'])
+        leaves['time'] = params['time'] = _Adjoint(tape, params['time'])
+        for k in ('rate', 'yld', 'sig'):
+            x = params[k]
+            if isinstance(x, Curve):
+                leaves[k] = [_Adjoint(tape, v) for v in x.values]
+                params[k] = x._adjoint_average(params['time'], opt.mat, leaves[k])
+            else:
+                leaves[k] = params[k] = _Adjoint(tape, x)
+
+        _backward(opt.PV(**params))
+
+        def grad(leaf): return 0.0 * leaf.value if leaf.grad is None else leaf.grad
+        return {k: np.array([grad(l) for l in leaf]) if isinstance(leaf, list) else grad(leaf)
+                    for k, leaf in leaves.items()}
+
 class Forward(OptionPricing):
     """
     
@@ -349,13 +1190,23 @@ class Forward(OptionPricing):
     
     def __init__(self, mat=None, strike=None, rate=None, yld=None, sig=None, spot=None, time=None):
         
-        self.strike =strike
+        self.strike = _float(strike)
         super().__init__(mat=mat, rate=rate, yld=yld, sig=sig, spot=spot, time=time)
         return
     
+    analytic = True
+    vectorised = True
+    adjoint = True
+    
     def FV(self, fwd=None, sig=None, time=None):
-        if fwd == None: fwd = self.Forward()
+        if fwd is None: fwd = self.Forward()
         return fwd - self.strike
+    
+    def FVGreeks(self, fwd=None, sig=None, time=None):
+        fv = self.FV(fwd=fwd)
+        zero = 0.0 * fv
+        return fv, 1.0 + zero, zero, zero, zero, zero
+
 class BSBase(OptionPricing):
     """
     
@@ -365,11 +1216,18 @@ class BSBase(OptionPricing):
     PARAMETERS (like OptionPricing, plus)
     strike - the strike price
     
+    the derived classes implement FVGreeks, so their Greeks are computed
+    analytically by default
+    
     """
     
+    analytic = True
+    vectorised = True
+    adjoint = True
+    
     def __init__(self, mat=None, strike=None, rate=None, yld=None, sig=None, spot=None, time=0.0):
         
-        self.strike = strike
+        self.strike = _float(strike)
         super().__init__(mat=mat, rate=rate, yld=yld, sig=sig, spot=spot, time=time)
         return
     
@@ -382,20 +1240,107 @@ class BSBase(OptionPricing):
             d2 = ( ln (F/S) - 0.5 sig^2 (T-t) ) / sig sqrt(T-t)
         
         """
-        if mat == None: mat = self.mat
-        if time == None: time = self.time
-        if fwd == None: fwd = self.Forward(mat=mat, time=time)
-        if strike == None: strike = self.strike
-        if sig == None: sig = self.sig
+        if mat is None: mat = self.mat
+        if time is None: time = self.time
+        if fwd is None: fwd = self.Forward(mat=mat, time=time)
+        if strike is None: strike = self.strike
+        if sig is None: sig = self.sig
+        sig = _effective(sig, time, mat)
+        if self.cachesize: return self._memo(('d12', fwd, sig, time, strike, mat), self._d12, fwd, sig, time, strike, mat)
+        return self._d12(fwd, sig, time, strike, mat)
+    
+    def _sig(self, sig, time):
+        """the effective vol to maturity (resolving VolCurve)"""
+        if sig is None: sig = self.sig
+        if time is None: time = self.time
+        return _effective(sig, time, self.mat)
+    
+    def _d12(self, fwd, sig, time, strike, mat):
         
-        lnfs = log(1.0*fwd/strike)
+        lnfs = _log(1.0*fwd/strike)
         sig2t = sig*sig*(mat - time)
-        sigsqrt = sig*sqrt(mat - time)
+        sigsqrt = sig*_sqrt(mat - time)
         d1 = (lnfs + 0.5 * sig2t) / sigsqrt
         d2 = (lnfs - 0.5 * sig2t) / sigsqrt
-        
+
         return d1,d2
 
+    _ivmin = 1e-6 # vol bracket for the implied vol solver
+    _ivmax = 10.0
+
+    def ImpliedVol(self, price, spot=None, time=None, rate=None, yld=None, tol=1e-10, maxiter=50):
+        """
+
+        the implied volatility, ie the vol for which PV equals the market price
+
+        all parameters can be arrays (as can the instance's strike, mat etc),
+        so a whole option chain can be inverted in one call; the solver starts
+        from the Corrado-Miller rational approximation and then takes Halley
+        steps based on the analytic vega and volga, falling back to bisection
+        whenever a step leaves the current bracket; only the quotes that have
+        not yet converged are carried through the iterations
+
+        quotes that violate the no-arbitrage bounds (ie PV below its zero vol
+        limit or above its value at 1000% vol), quotes whose time value is
+        below the rounding error of the price (deep ITM/OTM) and quotes for
+        which the solver does not converge are returned as nan rather than
+        raising
+
+        NOTE: this requires PV to be increasing in vol (eg calls and puts)
+
+        """
+        if spot is None: spot = self.spot
+        if time is None: time = self.time
+        if rate is None: rate = self.rate
+        if yld is None: yld = self.yld
+        df = self.df(rate=rate, time=time)
+        fwd = self.ff(rate=rate, yld=yld, time=time) * spot
+        target = np.asarray(price, dtype=float) / df
+
+        shape = np.broadcast(target, fwd, self.strike, self.mat, time).shape
+        target, fwd, strike, mat, time = (np.broadcast_to(a, shape).astype(float).ravel()
+                                            for a in (target, fwd, self.strike, self.mat, time))
+        opt = copy(self)
+        opt.strike, opt.mat = strike, mat
+        lo = np.full(target.shape, self._ivmin)
+        hi = np.full(target.shape, self._ivmax)
+        fvlo = opt.FV(fwd=fwd, sig=lo, time=time)
+        fvhi = opt.FV(fwd=fwd, sig=hi, time=time)
+
+        # Corrado-Miller initial guess on the call-equivalent forward price
+        c = target - fvlo + np.maximum(fwd - strike, 0.0)
+        m = c - 0.5 * (fwd - strike)
+        with np.errstate(invalid='ignore'):
+            v = sqrt(2.0*np.pi) / (fwd + strike) * (m + np.sqrt(np.maximum(m*m - (fwd - strike)**2 / np.pi, 0.0)))
+            sig = np.clip(v / np.sqrt(mat - time), 2*self._ivmin, 0.5*self._ivmax)
+        sig = np.where(np.isfinite(sig), sig, 0.2)
+
+        # time values that are lost in the rounding of the price do not determine a vol
+        tv = target - fvlo
+        result = np.full(target.shape, np.nan)
+        idx = np.flatnonzero((tv > 1e-12 * target) & (target < fvhi))
+        for i in range(maxiter):
+            if len(idx) == 0: break
+            opt.strike, opt.mat = strike[idx], mat[idx]
+            s = sig[idx]
+            g = opt.FVGreeks(fwd=fwd[idx], sig=s, time=time[idx])
+            f = g[0] - target[idx]
+            lo[idx] = np.where(f < 0, s, lo[idx])
+            hi[idx] = np.where(f > 0, s, hi[idx])
+            with np.errstate(divide='ignore', invalid='ignore'):
+                step = f / g[3]
+                step = step / (1.0 - np.clip(0.5 * step * g[4] / g[3], -0.5, 0.5))
+            new = s - step
+            new = np.where((new > lo[idx]) & (new < hi[idx]), new, 0.5 * (lo[idx] + hi[idx]))
+            done = (np.abs(f) <= tol * tv[idx]) | (np.abs(new - s) <= tol * s)
+            result[idx[done]] = np.where(np.abs(f) <= tol * tv[idx], s, new)[done]
+            sig[idx] = new
+            idx = idx[~done]
+
+        result = result.reshape(shape)
+        if result.ndim == 0: return float(result)
+        return result
+
 class BSCall(BSBase):
     """
     
@@ -412,9 +1357,21 @@ class BSCall(BSBase):
 
     def FV(self, fwd=None, sig=None, time=None):
         
-        if fwd == None: fwd = self.Forward()
+        if fwd is None: fwd = self.Forward()
         d1, d2 = self.d12(fwd=fwd, sig=sig, strike=self.strike, mat=self.mat, time=time)
-        return fwd * norm.cdf (d1) - self.strike * norm.cdf (d2)
+        return fwd * _ncdf(d1) - self.strike * _ncdf(d2)
+    
+    def FVGreeks(self, fwd=None, sig=None, time=None):
+        
+        if fwd is None: fwd = self.Forward()
+        sig = self._sig(sig, time)
+        d1, d2 = self.d12(fwd=fwd, sig=sig, strike=self.strike, mat=self.mat, time=time)
+        nd1 = _npdf(d1)
+        v = d1 - d2
+        nnd1 = _ncdf(d1)
+        fv = fwd * nnd1 - self.strike * _ncdf(d2)
+        return (fv, nnd1, nd1 / (fwd*v), fwd * nd1 * v / sig,
+                fwd * nd1 * v * d1 * d2 / (sig*sig), -nd1 * d2 / sig)
     
 
 class BSPut(BSBase):
@@ -433,9 +1390,21 @@ class BSPut(BSBase):
 
     def FV(self, fwd=None, sig=None, time=None):
         
-        if fwd == None: fwd = self.Forward()
+        if fwd is None: fwd = self.Forward()
         d1, d2 = self.d12(fwd=fwd, sig=sig, strike=self.strike, mat=self.mat, time=time)
-        return self.strike * norm.cdf (-d2) - fwd * norm.cdf (-d1)
+        return self.strike * _ncdf(-d2) - fwd * _ncdf(-d1)
+    
+    def FVGreeks(self, fwd=None, sig=None, time=None):
+        
+        if fwd is None: fwd = self.Forward()
+        sig = self._sig(sig, time)
+        d1, d2 = self.d12(fwd=fwd, sig=sig, strike=self.strike, mat=self.mat, time=time)
+        nd1 = _npdf(d1)
+        v = d1 - d2
+        nnd1 = _ncdf(-d1)
+        fv = self.strike * _ncdf(-d2) - fwd * nnd1
+        return (fv, -nnd1, nd1 / (fwd*v), fwd * nd1 * v / sig,
+                fwd * nd1 * v * d1 * d2 / (sig*sig), -nd1 * d2 / sig)
     
 
 class BSDCall(BSBase):
@@ -455,9 +1424,20 @@ class BSDCall(BSBase):
 
     def FV(self, fwd=None, sig=None, time=None):
         
-        if fwd == None: fwd = self.Forward()
+        if fwd is None: fwd = self.Forward()
+        d1, d2 = self.d12(fwd=fwd, sig=sig, strike=self.strike, mat=self.mat, time=time)
+        return _ncdf(d2)
+    
+    def FVGreeks(self, fwd=None, sig=None, time=None):
+        
+        if fwd is None: fwd = self.Forward()
+        sig = self._sig(sig, time)
         d1, d2 = self.d12(fwd=fwd, sig=sig, strike=self.strike, mat=self.mat, time=time)
-        return norm.cdf(d2)
+        nd2 = _npdf(d2)
+        v = d1 - d2
+        fv = _ncdf(d2)
+        return (fv, nd2 / (fwd*v), -nd2 * d1 / (fwd*fwd*v*v), -nd2 * d1 / sig,
+                nd2 * (d1 + d2 - d1*d1*d2) / (sig*sig), nd2 * (d1*d2 - 1.0) / (fwd*v*sig))
 
 
 class BSDPut(BSBase):
@@ -477,9 +1457,20 @@ class BSDPut(BSBase):
 
     def FV(self, fwd=None, sig=None, time=None):
         
-        if fwd == None: fwd = self.Forward()
+        if fwd is None: fwd = self.Forward()
         d1, d2 = self.d12(fwd=fwd, sig=sig, strike=self.strike, mat=self.mat, time=time)
-        return 1.0 - norm.cdf(d2)
+        return 1.0 - _ncdf(d2)
+    
+    def FVGreeks(self, fwd=None, sig=None, time=None):
+        
+        if fwd is None: fwd = self.Forward()
+        sig = self._sig(sig, time)
+        d1, d2 = self.d12(fwd=fwd, sig=sig, strike=self.strike, mat=self.mat, time=time)
+        nd2 = _npdf(d2)
+        v = d1 - d2
+        fv = 1.0 - _ncdf(d2)
+        return (fv, -nd2 / (fwd*v), nd2 * d1 / (fwd*fwd*v*v), nd2 * d1 / sig,
+                -nd2 * (d1 + d2 - d1*d1*d2) / (sig*sig), -nd2 * (d1*d2 - 1.0) / (fwd*v*sig))
 
 
 class BSRDCall(BSBase):
@@ -499,12 +1490,24 @@ class BSRDCall(BSBase):
 
     def FV(self, fwd=None, sig=None, time=None):
         
-        if fwd == None: fwd = self.Forward()
+        if fwd is None: fwd = self.Forward()
         d1, d2 = self.d12(fwd=fwd, sig=sig, strike=self.strike, mat=self.mat, time=time)
-        return fwd * norm.cdf(d1)
+        return fwd * _ncdf(d1)
+    
+    def FVGreeks(self, fwd=None, sig=None, time=None):
+        
+        if fwd is None: fwd = self.Forward()
+        sig = self._sig(sig, time)
+        d1, d2 = self.d12(fwd=fwd, sig=sig, strike=self.strike, mat=self.mat, time=time)
+        nd1 = _npdf(d1)
+        v = d1 - d2
+        nnd1 = _ncdf(d1)
+        fv = fwd * nnd1
+        return (fv, nnd1 + nd1 / v, -nd1 * d2 / (fwd*v*v), -fwd * nd1 * d2 / sig,
+                fwd * nd1 * (d1 + d2 - d1*d2*d2) / (sig*sig), nd1 * (d2*d2 - 1.0) / (sig*v))
 
 
-class BSDPut(BSBase):
+class BSRDPut(BSBase):
     """
     
     compute the price of a European reverse digital put option in a Black Scholes universe
@@ -521,8 +1524,493 @@ class BSDPut(BSBase):
 
     def FV(self, fwd=None, sig=None, time=None):
         
-        if fwd == None: fwd = self.Forward()
+        if fwd is None: fwd = self.Forward()
         d1, d2 = self.d12(fwd=fwd, sig=sig, strike=self.strike, mat=self.mat, time=time)
-        return fwd * (1.0 - norm.cdf(d1))
+        return fwd * (1.0 - _ncdf(d1))
+    
+    def FVGreeks(self, fwd=None, sig=None, time=None):
+        
+        if fwd is None: fwd = self.Forward()
+        sig = self._sig(sig, time)
+        d1, d2 = self.d12(fwd=fwd, sig=sig, strike=self.strike, mat=self.mat, time=time)
+        nd1 = _npdf(d1)
+        v = d1 - d2
+        nnd1 = 1.0 - _ncdf(d1)
+        fv = fwd * nnd1
+        return (fv, nnd1 - nd1 / v, nd1 * d2 / (fwd*v*v), fwd * nd1 * d2 / sig,
+                -fwd * nd1 * (d1 + d2 - d1*d2*d2) / (sig*sig), -nd1 * (d2*d2 - 1.0) / (sig*v))
+
+
+
+
+# the payoffs are partials of module level functions so that they can be
+# pickled, eg to be sent to the worker processes of MonteCarlo.simulate
+def _payoff_call(strike, x): return np.maximum(x - strike, 0.0)
+def _payoff_put(strike, x): return np.maximum(strike - x, 0.0)
+def _payoff_fwd(strike, x): return x - strike
+def _payoff_straddle(strike, x): return np.abs(x - strike)
+
+def payoff_call(strike):
+    """vectorised call payoff max(x-K, 0), for use with MCEuropean"""
+    return partial(_payoff_call, strike)
+
+def payoff_put(strike):
+    """vectorised put payoff max(K-x, 0), for use with MCEuropean"""
+    return partial(_payoff_put, strike)
+
+def payoff_fwd(strike):
+    """vectorised forward payoff x-K, for use with MCEuropean"""
+    return partial(_payoff_fwd, strike)
+
+def payoff_straddle(strike):
+    """vectorised straddle payoff |x-K|, for use with MCEuropean"""
+    return partial(_payoff_straddle, strike)
+
+
+class MCEuropean(OptionPricing):
+    """
+    
+    compute the price of a European option with an arbitrary payoff in a
+    Black Scholes universe using Monte Carlo
+    
+        FV = E[ payoff(F_T) ]
+        F_T = F exp( -0.5 sig^2 (T-t) + sig sqrt(T-t) Z )
+    
+    the standard normal draws Z are generated once (on first use) and then
+    cached, so the base PV and all the bumped PVs that the Greeks in the base
+    class are computed from are evaluated on the same draws (common random
+    numbers); this keeps the Greeks stable even for a moderate number of paths
+    
+    PARAMETERS (like OptionPricing, plus)
+        payoff - vectorised payoff function, mapping an array of values of the
+                    underlying at maturity onto an array of payoffs (see eg
+                    payoff_call, payoff_put)
+        N - the number of paths (default = 10000; rounded down to an even
+                    number if antithetic)
+        seed - the seed (or numpy Generator) used to generate the draws
+        antithetic - if True (default), use antithetic variates, ie Z and -Z
+        sampler - "pseudo" (default) for numpy pseudo random normals, or
+                    "sobol" for scrambled Sobol normals (see QuasiRandom),
+                    which converge much faster (best with N a power of 2)
+    
+    NOTE: for the Sobol sampler FVError is the error of a pseudo random
+    estimate with the same number of paths, ie it overstates the actual error
+    (use several seeds to estimate that)
+    
+    """
+    
+    def __init__(self, mat=None, payoff=None, rate=None, yld=None, sig=None, spot=None, time=None,
+                    N=10000, seed=None, antithetic=True, sampler="pseudo"):
+        
+        self.payoff = payoff
+        self.N = int(N)
+        self.seed = seed
+        self.antithetic = antithetic
+        self.sampler = sampler
+        self._z = None
+        super().__init__(mat=mat, rate=rate, yld=yld, sig=sig, spot=spot, time=time)
+        return
+    
+    def _invalidate(self, name):
+        
+        super()._invalidate(name)
+        if name in ('N', 'seed', 'antithetic', 'sampler'): self._z = None
+    
+    def draws(self):
+        """
+        
+        returns the (cached) block of standard normal draws; when antithetic
+        is set the second half of the block is the negative of the first half
+        
+        """
+        if self._z is None:
+            n = self.N // 2 if self.antithetic else self.N
+            if self.sampler == "sobol":
+                z = _qrandom.normals(n, 1, seed=self.seed)[:, 0]
+            elif self.sampler == "pseudo":
+                z = np.random.default_rng(self.seed).standard_normal(n)
+            else:
+                raise ValueError("unknown sampler: %s" % self.sampler)
+            self._z = np.concatenate((z, -z)) if self.antithetic else z
+        return self._z
+    
+    def payoffs(self, fwd=None, sig=None, time=None):
+        """
+        
+        returns the array of simulated payoffs, one per path along the first axis
+        (array valued parameters are broadcast along the remaining axes)
+        
+        """
+        if fwd is None: fwd = self.Forward()
+        if sig is None: sig = self.sig
+        if time is None: time = self.time
+        sig = _effective(sig, time, self.mat)
+        tau = self.mat - time
+        z = self.draws()
+        z = z.reshape(z.shape + (1,) * np.ndim(np.broadcast(fwd, sig, tau)))
+        x = fwd * np.exp(-0.5 * sig * sig * tau + sig * np.sqrt(tau) * z)
+        return self.payoff(x)
+    
+    def FV(self, fwd=None, sig=None, time=None):
+        
+        fv = np.mean(self.payoffs(fwd=fwd, sig=sig, time=time), axis=0)
+        if np.ndim(fv) == 0: return float(fv)
+        return fv
+    
+    def FVError(self, fwd=None, sig=None, time=None):
+        """
+        
+        the standard error of the Monte Carlo estimate of the forward value
+        (with antithetic variates the two legs of every pair are averaged first,
+        as they are not independent)
+        
+        """
+        po = self.payoffs(fwd=fwd, sig=sig, time=time)
+        if self.antithetic:
+            n = len(po) // 2
+            po = 0.5 * (po[:n] + po[n:])
+        err = np.std(po, axis=0, ddof=1) / sqrt(len(po))
+        if np.ndim(err) == 0: return float(err)
+        return err
+
+
+class PDEPricing(OptionPricing):
+    """
+    
+    compute the price of a European or American option with an arbitrary
+    payoff in a Black Scholes universe by solving the Black Scholes PDE
+    
+        dV/dt + (r-y) S dV/dS + 0.5 sig^2 S^2 d^2V/dS^2 - r V = 0
+    
+    on a grid that is uniform in x = ln S, using a Crank-Nicolson scheme
+    (with Rannacher start-up, ie the first time steps are fully implicit to
+    damp the oscillations from non-smooth payoffs); every time step is a
+    tridiagonal solve (scipy.linalg.solve_banded); American options are
+    projected onto the exercise value after every step
+    
+    the solved grid is cached, and Delta, Gamma and Theta are read off that
+    one grid (as are PVs at bumped spots within the grid) rather than by
+    re-solving; bumps in vol, rates and yield require a new solve
+    
+    PARAMETERS (like OptionPricing, plus)
+        payoff - vectorised payoff function of the spot at maturity (or at
+                    the exercise time for American options, see eg payoff_call)
+        american - if True, the option can be exercised at any time
+        nS - number of spot grid points (default = 401)
+        nT - number of time steps (default = 200)
+        width - half-width of the grid in standard deviations (default = 5)
+    
+    NOTE: unlike the analytic classes PDEPricing only works with scalars,
+    and not with term structures (Curve, VolCurve)
+    
+    """
+    
+    _rannacher = 2 # number of fully implicit steps at the start
+    
+    def __init__(self, mat=None, payoff=None, rate=None, yld=None, sig=None, spot=None, time=None,
+                    american=False, nS=401, nT=200, width=5.0):
+        
+        self.payoff = payoff
+        self.american = american
+        self.nS = int(nS) | 1 # odd, so that spot is on the central node
+        self.nT = int(nT)
+        self.width = float(width)
+        self._grid = None
+        super().__init__(mat=mat, rate=rate, yld=yld, sig=sig, spot=spot, time=time)
+        return
+    
+    def _invalidate(self, name):
+        
+        super()._invalidate(name)
+        self._grid = None
+    
+    def grid(self, time=None, rate=None, yld=None, sig=None):
+        """
+        
+        solves the PDE from maturity back to time, and returns the grid
+        
+            (x, v, vdt, dt)
+        
+        where x are the log spots, v are the values at time, and vdt the
+        values at time+dt; the last grid is cached, ie calls with the
+        same parameters return it without solving again
+        
+        """
+        if time is None: time = self.time
+        if rate is None: rate = self.rate
+        if yld is None: yld = self.yld
+        if sig is None: sig = self.sig
+        key = (time, rate, yld, sig, self.spot, self.mat)
+        if self._grid is not None and self._grid[0] == key: return self._grid[1]
+        
+        n = self.nS
+        tau = self.mat - time
+        dt = tau / self.nT
+        # the grid geometry only depends on the instance's own parameters, so that
+        # bumped solves (eg for Vega or Volga) use the same nodes
+        h = 2.0 * self.width * self.sig * sqrt(self.mat - self.time) / (n - 1)
+        x = log(self.spot) + h * (np.arange(n) - (n - 1) // 2)
+        s = np.exp(x)
+        exercise = self.payoff(s) if self.american else None
+        
+        # L V = a V[i-1] + b V[i] + c V[i+1]
+        mu = rate - yld - 0.5 * sig * sig
+        a = 0.5 * sig * sig / (h*h) - 0.5 * mu / h
+        b = -sig * sig / (h*h) - rate
+        c = 0.5 * sig * sig / (h*h) + 0.5 * mu / h
+        
+        def system(theta):
+            ab = np.zeros((3, n))
+            ab[0, 2:] = -theta * dt * c
+            ab[1, 1:-1] = 1.0 - theta * dt * b
+            ab[2, :-2] = -theta * dt * a
+            ab[1, 0] = ab[1, -1] = 1.0 # Dirichlet boundaries
+            return ab
+        
+        v = self.payoff(s).astype(float)
+        vdt = v
+        for k in range(self.nT):
+            theta = 1.0 if k < self._rannacher else 0.5
+            if k == 0 or k == self._rannacher: ab = system(theta)
+            t = self.mat - (k + 1) * dt
+            rhs = v.copy()
+            rhs[1:-1] += (1.0 - theta) * dt * (a * v[:-2] + b * v[1:-1] + c * v[2:])
+            # far from the centre the option is deterministic: discounted payoff of the forward
+            df = exp(-rate * (self.mat - t))
+            ff = exp((rate - yld) * (self.mat - t))
+            rhs[[0, -1]] = df * self.payoff(s[[0, -1]] * ff)
+            vdt, v = v, _linalg.solve_banded((1, 1), ab, rhs)
+            if self.american: v = np.maximum(v, exercise)
+        
+        res = (x, v, vdt, dt)
+        self._grid = (key, res)
+        return res
+    
+    def _readoff(self, spot=None, time=None, rate=None, yld=None, sig=None):
+        """
+        
+        returns (V, dV/dS, d^2V/dS^2, dV/dt) at spot, read off the grid using
+        quadratic interpolation between the nearest three nodes
+        
+        """
+        if spot is None: spot = self.spot
+        x, v, vdt, dt = self.grid(time=time, rate=rate, yld=yld, sig=sig)
+        h = x[1] - x[0]
+        xs = log(spot)
+        i = min(max(int(round((xs - x[0]) / h)), 1), len(x) - 2)
+        u = (xs - x[i]) / h
+        d1 = 0.5 * (v[i+1] - v[i-1])
+        d2 = v[i+1] - 2.0 * v[i] + v[i-1]
+        val = v[i] + u * d1 + 0.5 * u * u * d2
+        vx = (d1 + u * d2) / h
+        vxx = d2 / (h*h)
+        valdt = vdt[i] + u * 0.5 * (vdt[i+1] - vdt[i-1]) + 0.5 * u * u * (vdt[i+1] - 2.0 * vdt[i] + vdt[i-1])
+        return float(val), float(vx / spot), float((vxx - vx) / (spot*spot)), float((valdt - val) / dt)
+    
+    def PV(self, spot=None, time=None, rate=None, yld=None, sig=None):
+        
+        return self._readoff(spot=spot, time=time, rate=rate, yld=yld, sig=sig)[0]
+    
+    def FV(self, fwd=None, sig=None, time=None):
+        
+        if fwd is None: fwd = self.Forward(time=time)
+        return self.PV(spot=fwd/self.ff(time=time), sig=sig, time=time) / self.df(time=time)
+    
+    def Delta(self, spot=None, time=None, rate=None, yld=None, sig=None):
+        
+        return self._readoff(spot=spot, time=time, rate=rate, yld=yld, sig=sig)[1]
+    
+    def Gamma(self, spot=None, time=None, rate=None, yld=None, sig=None):
+        
+        return self._readoff(spot=spot, time=time, rate=rate, yld=yld, sig=sig)[2]
+    
+    def Theta(self, spot=None, time=None, rate=None, yld=None, sig=None):
+        
+        return 0.0027397260273972603 * self._readoff(spot=spot, time=time, rate=rate, yld=yld, sig=sig)[3]
+    
+    def risk(self, spot=None, time=None, rate=None, yld=None, sig=None):
+        """
+        
+        PV and all Greeks (see OptionPricing.risk) with one solve per scenario:
+        PV, Delta, Gamma and Theta are read off the unbumped grid, Vega, Volga
+        and Vanna off the grids at sig +/- 0.01 (solved one after the other, so
+        that the grid cache is not thrashed), and Rho and RhoYld off the grids
+        with bumped rate and yield, ie five solves in all
+        
+        """
+        if spot is None: spot = self.spot
+        if sig is None: sig = self.sig
+        kw = dict(spot=spot, time=time, rate=rate, yld=yld)
+        pv, delta, gamma, dvdt = self._readoff(sig=sig, **kw)
+        pvsp, deltasp = self._readoff(sig=sig+0.01, **kw)[:2]
+        pvsm, deltasm = self._readoff(sig=sig-0.01, **kw)[:2]
+        
+        if time is None: time = self.time
+        if rate is None: rate = self.rate
+        if yld is None: yld = self.yld
+        pvr = self.PV(spot=spot, time=time, rate=rate+0.01, yld=yld, sig=sig)
+        pvy = self.PV(spot=spot, time=time, rate=rate, yld=yld+0.01, sig=sig)
+        
+        return {
+            'PV': pv,
+            'Delta': delta,
+            'DeltaCash': spot * delta,
+            'Gamma': gamma,
+            'GammaCash': spot*spot * gamma,
+            'Vega': pvsp - pv,
+            'Theta': 0.0027397260273972603 * dvdt,
+            'Rho': pvr - pv,
+            'RhoYld': pvy - pv,
+            'Volga': pvsp + pvsm - 2.0*pv,
+            'Vanna': (deltasp - deltasm)/0.02,
+        }
+
+
+# the methods that are wrapped by instrument(); every call is counted, and
+# the calls made while no other instrumented method is running (ie the ones
+# made by the user) are the top level calls that are timed
+INSTRUMENTED = ('PV', 'FV', 'FVGreeks', 'd12', 'df', 'fdf', 'ff', 'Forward',
+                'Delta', 'DeltaCash', 'DeltaFwd', 'DeltaFwdCash', 'Gamma', 'GammaCash',
+                'Vega', 'Theta', 'Rho', 'RhoYld', 'Volga', 'Vanna', 'risk', 'ladder',
+                'RhoBuckets', 'VegaBuckets', 'gradient', 'ImpliedVol')
 
 
+class PricingStats:
+    """
+    
+    the counters collected by instrument()
+    
+        calls - dict (class, top, method) -> number of calls of method made
+                    within top level calls of top (eg ("BSCall", "Vanna", "FV"))
+        seconds - dict (class, top) -> wall time spent in top level calls of top
+    
+    the class is the name of the class of the instance the method was called on
+    
+    """
+    
+    def __init__(self):
+        self.calls = {}
+        self.seconds = {}
+        self._top = None
+    
+    def reset(self):
+        """
+        
+        clears all counters
+        
+        """
+        self.calls.clear()
+        self.seconds.clear()
+    
+    def count(self, method=None, top=None, cls=None):
+        """
+        
+        the number of calls of method (eg "FV") made within top level calls of
+        top (eg "Vanna") on instances of cls (a class or its name); arguments
+        that are None match everything
+        
+        """
+        if isinstance(cls, type): cls = cls.__name__
+        return sum(n for (c, t, m), n in self.calls.items()
+                    if (cls is None or c == cls) and (top is None or t == top) and (method is None or m == method))
+    
+    def time(self, top=None, cls=None):
+        """
+        
+        the wall time (in seconds) spent in top level calls of top on
+        instances of cls (None matches everything)
+        
+        """
+        if isinstance(cls, type): cls = cls.__name__
+        return sum(s for (c, t), s in self.seconds.items()
+                    if (cls is None or c == cls) and (top is None or t == top))
+    
+    def table(self):
+        """
+        
+        one row per (class, top) as tuple
+        
+            (class, top, calls, seconds, PV calls, FV calls, d12 calls)
+        
+        """
+        return [(c, t, self.calls.get((c, t, t), 0), s, self.calls.get((c, t, 'PV'), 0),
+                    self.calls.get((c, t, 'FV'), 0), self.calls.get((c, t, 'd12'), 0))
+                    for (c, t), s in sorted(self.seconds.items())]
+    
+    def __str__(self):
+        lines = ["%-12s %-12s %8s %12s %8s %8s %8s" % ("class", "top", "calls", "us/call", "PV", "FV", "d12")]
+        for c, t, n, s, pv, fv, d12 in self.table():
+            lines.append("%-12s %-12s %8d %12.2f %8d %8d %8d" % (c, t, n, 1e6*s/n, pv, fv, d12))
+        return "\n".join(lines)
+
+
+def _instrumented(fn, name, stats):
+    """
+    
+    wraps the method fn (called name) so that its calls are counted in stats
+    
+    """
+    @wraps(fn)
+    def wrapper(self, *args, **kwargs):
+        cls = self.__class__.__name__
+        top = stats._top
+        if top is not None:
+            key = (cls, top, name)
+            stats.calls[key] = stats.calls.get(key, 0) + 1
+            return fn(self, *args, **kwargs)
+        key = (cls, name, name)
+        stats.calls[key] = stats.calls.get(key, 0) + 1
+        stats._top = name
+        t0 = perf_counter()
+        try:
+            return fn(self, *args, **kwargs)
+        finally:
+            stats._top = None
+            key = (cls, name)
+            stats.seconds[key] = stats.seconds.get(key, 0.0) + perf_counter() - t0
+    return wrapper
+
+
+@contextmanager
+def instrument(stats=None):
+    """
+    
+    context manager that counts the calls of the pricing methods (see
+    INSTRUMENTED), per top level method and class, and times the top level
+    calls, eg
+    
+        with instrument() as stats:
+            BSCall(mat=1, strike=100, spot=100, sig=0.2).Vanna()
+        stats.count("FV", top="Vanna")
+        print(stats)
+    
+    while active, the methods of OptionPricing and all its subclasses are
+    replaced by counting wrappers, and they are restored on exit; so outside
+    of the context there is no overhead at all
+    
+    stats - a PricingStats to add the counts to (default: a new one)
+    
+    NOTE: this is not thread safe, and calls made in other processes (eg
+    ladder with a process pool) are not counted
+    
+    """
+    if stats is None: stats = PricingStats()
+    classes, todo = [], [OptionPricing]
+    while todo:
+        cls = todo.pop()
+        if cls in classes: continue
+        classes.append(cls)
+        todo.extend(cls.__subclasses__())
+    
+    patched = []
+    try:
+        for cls in classes:
+            for name in INSTRUMENTED:
+                fn = cls.__dict__.get(name)
+                if fn is None: continue
+                patched.append((cls, name, fn))
+                setattr(cls, name, _instrumented(fn, name, stats))
+        yield stats
+    finally:
+        for cls, name, fn in patched: setattr(cls, name, fn)
+        stats._top = None
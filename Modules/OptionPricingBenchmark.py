@@ -0,0 +1,315 @@
+"""
+Option Pricing Benchmarks
+
+
+benchmarks for the OptionPricing module; run as a script to print the
+results, eg
+
+    python OptionPricingBenchmark.py                   # print the tables
+    python OptionPricingBenchmark.py --json run.json   # also save the suite
+    python OptionPricingBenchmark.py --compare old.json new.json
+
+per_call - best time per call of a function
+peak_memory - peak memory allocated during one call of a function
+scipy_norm - context manager making OptionPricing use scipy.stats.norm
+norm_kernel - per-option cost of PV and Greeks, normal kernel vs scipy.stats.norm
+import_time - cold start cost of importing OptionPricing (python -X importtime)
+suite - PV and every Greek of every product class, on scalars and on books
+    of several sizes, with options/sec and peak memory
+save, load, compare - store suite results as JSON (with the commit and the
+    library versions), and compare two runs, eg before and after a change
+
+
+DEPENDENCIES
+
+OptionPricing
+numpy
+scipy
+timeit
+tracemalloc
+subprocess
+json
+
+
+AUTHOR AND COPYRIGHT
+
+Copyright (c) 2014
+Stefan LOESCH, oditorium
+http://www.oditorium.com
+
+
+IMPORTANT LEGAL INFORMATION
+
+This software is distributed WITHOUT ANY WARRANTY and without even the
+implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE,
+and it does NOT CONSTITUTE INVESTMENT ADVICE. It shall not be used for
+other than academic purposes, and in particular IT SHOULD NOT BE RELIED
+UPON TO PRICE OR RISK MANAGE ACTUAL PORTFOLIOS.
+
+This software is licensed under the Gnu AGPL v3.0. See the LICENSE file
+or see http://www.gnu.org/licenses/
+
+"""
+
+__version__ = "0.1a"
+
+#-----------------------------------------------------------------------------
+#  Copyright (c) 2014  Stefan LOESCH, oditorium
+#
+#  Distributed under the terms of the AGPL License.
+#
+#  The full license is in the file LICENSE, distributed with this software.
+#-----------------------------------------------------------------------------
+
+import os
+import sys
+import json
+import time
+import timeit
+import platform
+import tracemalloc
+import subprocess
+from contextlib import contextmanager
+import numpy as np
+import scipy
+import OptionPricing as op
+
+GREEKS = ('PV', 'Delta', 'Gamma', 'Vega', 'Theta', 'Rho', 'RhoYld', 'Volga', 'Vanna')
+METHODS = ('PV', 'Delta', 'DeltaCash', 'Gamma', 'GammaCash', 'Vega', 'Theta',
+            'Rho', 'RhoYld', 'Volga', 'Vanna', 'risk')
+CLASSES = (op.Forward, op.BSCall, op.BSPut, op.BSDCall, op.BSDPut, op.BSRDCall, op.BSRDPut,
+            op.MCEuropean, op.PDEPricing)
+SIZES = (None, 10, 1000, 100000) # None = scalar parameters
+
+
+def per_call(fn, number=None, repeat=5):
+    """ returns the best time per call of fn (in seconds)
+
+    number - calls per timing run (default: chosen by timeit.autorange)
+    repeat - number of timing runs (the fastest one is reported)
+    """
+    t = timeit.Timer(fn)
+    if number is None: number, _ = t.autorange()
+    return min(t.repeat(repeat=repeat, number=number)) / number
+
+
+def peak_memory(fn):
+    """ returns the peak memory allocated (in bytes) during one call of fn,
+    as traced by tracemalloc (which includes numpy's array buffers)
+    """
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+@contextmanager
+def scipy_norm():
+    """ context manager that makes OptionPricing use scipy.stats.norm
+
+    this is what the module used before it had its own normal kernel, so it
+    serves as the reference point for the benchmarks
+    """
+    from scipy.stats import norm
+    ncdf, npdf = op._ncdf, op._npdf
+    op._ncdf, op._npdf = norm.cdf, norm.pdf
+    try:
+        yield
+    finally:
+        op._ncdf, op._npdf = ncdf, npdf
+
+
+def norm_kernel(cls=op.BSCall, greeks=GREEKS, analytic=True):
+    """ per-option cost of PV and the Greeks, normal kernel vs scipy.stats.norm
+
+    cls - the option class to be benchmarked
+    greeks - the methods to be timed
+    analytic - whether to use analytic Greeks (otherwise bump-and-revalue)
+
+    RETURNS
+        dict greek -> (time with scipy.stats.norm, time with kernel, speedup)
+    """
+    o = cls(mat=1, strike=100, spot=100, sig=0.2, rate=0.05, yld=0.01)
+    o.analytic = analytic
+    res = {}
+    for g in greeks:
+        fn = getattr(o, g)
+        with scipy_norm(): old = per_call(fn)
+        new = per_call(fn)
+        res[g] = (old, new, old/new)
+    return res
+
+
+def import_time(module="OptionPricing", repeat=5):
+    """ cold start cost of importing module, measured in fresh interpreters
+
+    uses `python -X importtime`, and reports the best of repeat runs; also
+    checks which heavy numerical packages the bare import has pulled in, and
+    how long the first scalar option price takes (including the import)
+
+    RETURNS
+        dict with keys
+            import_us - cumulative import time of module (microseconds)
+            first_pv_us - import plus first BSCall.PV (microseconds)
+            heavy_modules - the heavy packages loaded by the import alone
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    def run(code, *flags):
+        return subprocess.run([sys.executable] + list(flags) + ["-c", code],
+                    cwd=here, capture_output=True, text=True, check=True)
+
+    best = None
+    for i in range(repeat):
+        err = run("import %s" % module, "-X", "importtime").stderr
+        line = [l for l in err.splitlines() if l.rstrip().endswith("| " + module)][-1]
+        us = int(line.split("|")[1])
+        best = us if best is None else min(best, us)
+
+    first_pv = min(float(run(
+        "import time; t=time.perf_counter(); import %s as m; "
+        "m.BSCall(mat=1, strike=100, spot=100, sig=0.2).PV(); "
+        "print(1e6*(time.perf_counter()-t))" % module).stdout) for i in range(repeat))
+
+    heavy = run("import sys, %s; print(' '.join(m for m in ('numpy', 'scipy', 'pandas') "
+                "if m in sys.modules))" % module).stdout.split()
+
+    return {'import_us': best, 'first_pv_us': first_pv, 'heavy_modules': heavy}
+
+
+def option(cls, size=None):
+    """ the benchmark instance of cls: at the money-ish with scalar parameters
+    for size None, otherwise a book of size strikes between 80 and 120
+    """
+    strike = 100.0 if size is None else np.linspace(80.0, 120.0, size)
+    market = dict(mat=1.0, spot=100.0, sig=0.2, rate=0.05, yld=0.01)
+    if cls is op.MCEuropean: return cls(payoff=op.payoff_call(strike), seed=1, **market)
+    if cls is op.PDEPricing: return cls(payoff=op.payoff_call(strike), **market)
+    return cls(strike=strike, **market)
+
+
+def suite(classes=CLASSES, methods=METHODS, sizes=SIZES, analytic=True, target=0.05, repeat=3):
+    """ times PV and the Greeks for every product class and book size
+
+    classes - the classes to be benchmarked; those that can not be priced
+                on arrays (vectorised False) are only run on scalars
+    methods - the methods to be timed (method names of OptionPricing)
+    sizes - the book sizes (None = scalar parameters)
+    analytic - whether to use analytic Greeks where the class has them
+    target - approximate duration of one timing run (in seconds)
+    repeat - number of timing runs (the fastest one is reported)
+
+    every method is called once before it is timed, and the instance is
+    reused, so the timings are those of warm calls (eg with the draws of
+    MCEuropean and the grid of PDEPricing already cached)
+
+    RETURNS
+        list of dicts with the keys class, method, analytic, size, seconds
+        (per call), options_per_sec and peak_bytes (of one call)
+    """
+    res = []
+    for cls in classes:
+        for size in sizes:
+            if size is not None and not cls.vectorised: continue
+            o = option(cls, size)
+            o.analytic = analytic and cls.analytic
+            for m in methods:
+                fn = getattr(o, m)
+                t0 = time.perf_counter()
+                fn()
+                once = time.perf_counter() - t0
+                t = per_call(fn, number=max(1, int(target / max(once, 1e-7))), repeat=repeat)
+                res.append({'class': cls.__name__, 'method': m, 'analytic': o.analytic,
+                            'size': size, 'seconds': t, 'options_per_sec': (size or 1) / t,
+                            'peak_bytes': peak_memory(fn)})
+    return res
+
+
+def _git_commit():
+    try:
+        here = os.path.dirname(os.path.abspath(__file__))
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=here,
+                        capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save(results, filename):
+    """ saves suite results as JSON, together with the current commit, the
+    library versions and the machine, so that runs can be compared later
+    """
+    meta = {'commit': _git_commit(), 'time': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'python': platform.python_version(), 'numpy': np.__version__,
+            'scipy': scipy.__version__, 'machine': platform.platform()}
+    with open(filename, "w") as f:
+        json.dump({'meta': meta, 'results': results}, f, indent=1)
+
+
+def load(filename):
+    """ loads suite results saved with save; returns (meta, results)
+    """
+    with open(filename) as f:
+        d = json.load(f)
+    return d['meta'], d['results']
+
+
+def compare(old, new, threshold=0.1):
+    """ compares two suite runs (lists of results, eg from load)
+
+    RETURNS
+        list of (class, method, analytic, size, old seconds, new seconds,
+        ratio) for the benchmarks in both runs whose time changed by more
+        than threshold (relative), slowest regression first
+    """
+    def key(r): return (r['class'], r['method'], r['analytic'], r['size'])
+    before = {key(r): r['seconds'] for r in old}
+    res = []
+    for r in new:
+        if key(r) not in before: continue
+        ratio = r['seconds'] / before[key(r)]
+        if abs(ratio - 1.0) > threshold: res.append(key(r) + (before[key(r)], r['seconds'], ratio))
+    return sorted(res, key=lambda x: -x[-1])
+
+
+def _print_suite(results):
+    print("    %-10s %-9s %-8s %7s %12s %14s %12s" %
+            ("class", "method", "greeks", "size", "us/call", "options/sec", "peak (kB)"))
+    for r in results:
+        print("    %-10s %-9s %-8s %7s %12.2f %14.0f %12.1f" % (r['class'], r['method'],
+                "analytic" if r['analytic'] else "bumped", r['size'] or "scalar",
+                1e6*r['seconds'], r['options_per_sec'], r['peak_bytes']/1024))
+    print()
+
+
+def _print_table(title, res):
+    print(title)
+    print("    %-8s %12s %12s %8s" % ("", "scipy (us)", "kernel (us)", "speedup"))
+    for k, (old, new, speedup) in res.items():
+        print("    %-8s %12.2f %12.2f %7.1fx" % (k, 1e6*old, 1e6*new, speedup))
+    print()
+
+
+if __name__ == "__main__":
+
+    if sys.argv[1:2] == ["--compare"]:
+        (m0, r0), (m1, r1) = load(sys.argv[2]), load(sys.argv[3])
+        print("%s (%s) -> %s (%s)" % (sys.argv[2], m0['commit'], sys.argv[3], m1['commit']))
+        for c, m, a, s, t0, t1, ratio in compare(r0, r1):
+            print("    %-10s %-9s %-8s %7s %10.2f -> %10.2f us  %5.2fx" %
+                    (c, m, "analytic" if a else "bumped", s or "scalar", 1e6*t0, 1e6*t1, ratio))
+        sys.exit(0)
+
+    results = suite() + suite(classes=(op.BSCall,), analytic=False)
+    print("PV and Greeks")
+    _print_suite(results)
+    if sys.argv[1:2] == ["--json"]: save(results, sys.argv[2])
+
+    _print_table("BSCall, analytic Greeks", norm_kernel(analytic=True))
+    _print_table("BSCall, bumped Greeks", norm_kernel(analytic=False))
+
+    res = import_time()
+    print("import OptionPricing")
+    print("    import          %10.0f us" % res['import_us'])
+    print("    import + PV     %10.0f us" % res['first_pv_us'])
+    print("    heavy modules   %s" % (", ".join(res['heavy_modules']) or "none"))
@@ -7,10 +7,59 @@ the generated DataFrame currently uses _manual_ indexing, the idea being
 that this can serve as something like a key-value store (where the value
 can be complex, ie consist of more than one item)
 
+by default every change rewrites the whole file; in journal mode the
+changes are instead appended to a log file next to it (one line of json per
+change), and the file is only rewritten every so many changes and on
+close; on opening, the file is read and the log replayed on top of it
+
+    with PDataFrame("store.csv", journal=True) as pdf:
+        pdf.set("key", (1, 2))
+
+for bulk changes, batch() buffers sets and deletes and applies them in one
+go when the block ends, persisting them once (and not at all if the block
+raises an exception); set_many does the same for a collection of rows
+
+    with pdf.batch():
+        for k, v in rows: pdf.set(k, v)
+
+the file is written to a temporary file that then replaces it, so a
+crash while saving leaves the previous version intact
+
+deleted rows are only marked as deleted (which takes constant time), and
+removed from the frame in one go once they make up a quarter of it, or when
+the frame is saved or accessed with df(); in journal mode a delete therefore
+costs the same whatever the size of the frame
+
+get() keeps the rows it returned as dicts in an LRU cache (each entry is
+dropped when its row changes), and builds missing ones from the columns as
+numpy arrays, looked up through the hash table of the index; get_many()
+returns many rows with a single lookup
+
+besides csv, the frame can be stored in binary formats, chosen by the
+extension of the filename (or the backend argument)
+
+    .csv - csv (text; the dtypes are guessed when reading)
+    .parquet - Parquet (columnar, compressed; needs pyarrow)
+    .feather - Feather (columnar, fast to read; needs pyarrow)
+    .npy - a NumPy structured array, one field per column plus the index
+
+the NumPy file is memory mapped when opened with readonly=True: nothing is
+parsed, the numeric columns are views of the file, and all processes reading
+the same file share their pages (saving replaces the file, so readers keep
+seeing the version they opened); the index, and string columns (stored as
+fixed width unicode), are however converted into memory when the file is
+opened, which is fast for a numeric index (about 10 ms for 2M rows) but
+O(rows) with python objects for string keys (about 0.3 s for 2M rows, plus
+about 1 s for building the hash table of the index on the first lookup)
+
+    pdf = PDataFrame("store.npy", readonly=True)
+
 DEPENDENCIES
 
 pandas
 numpy
+json
+pyarrow (optional; for Parquet and Feather)
 
 
 AUTHOR AND COPYRIGHT
@@ -43,19 +92,149 @@ __version__ = "0.1a"
 #  The full license is in the file LICENSE, distributed with this software.
 #-----------------------------------------------------------------------------
 
+import os
+import json
+from contextlib import contextmanager
+from collections import OrderedDict
 import pandas as pd
 import numpy as np
 
+
+class _CSV:
+    """ csv files (the dtypes are guessed when reading)
+    """
+    
+    @staticmethod
+    def read(filename, readonly=False):
+        return pd.read_csv(filename, index_col=0)
+    
+    @staticmethod
+    def write(df, f):
+        df.to_csv(f, index=True)
+
+
+class _Parquet:
+    """ Parquet files (via pandas, which needs pyarrow)
+    """
+    
+    @staticmethod
+    def read(filename, readonly=False):
+        return pd.read_parquet(filename)
+    
+    @staticmethod
+    def write(df, f):
+        df.to_parquet(f, index=True)
+
+
+class _Feather:
+    """ Feather files (via pandas, which needs pyarrow); Feather can not store
+    an index, so it is stored as the first column
+    """
+    
+    @staticmethod
+    def read(filename, readonly=False):
+        df = pd.read_feather(filename)
+        df = df.set_index(df.columns[0])
+        df.index.name = None
+        return df
+    
+    @staticmethod
+    def write(df, f):
+        df = df.copy()
+        df.index.name = "__index__"
+        df.reset_index().to_feather(f)
+
+
+class _NumPy:
+    """ NumPy structured arrays (.npy), one field per column, the index being
+    the field __index__; object columns that only hold numbers are stored as
+    numbers, other object columns as fixed width unicode, with their missing
+    values marked in a boolean field __null__<column>
+    """
+    
+    INDEX = "__index__"
+    NULL = "__null__"
+    
+    @staticmethod
+    def _array(values):
+        values = np.asarray(values)
+        if values.dtype.kind in "biufcmM": return values
+        kind = pd.api.types.infer_dtype(values, skipna=True)
+        if kind in ("integer", "floating", "mixed-integer-float"):
+            null = pd.isna(values)
+            if kind == "integer" and not null.any(): return values.astype(np.int64)
+            return np.where(null, np.nan, values).astype(float)
+        values = values.astype(str)
+        return values.astype("U%d" % max(values.dtype.itemsize // 4, 1))
+    
+    @staticmethod
+    def read(filename, readonly=False):
+        arr = np.load(filename, mmap_mode="r" if readonly else None)
+        names = arr.dtype.names
+        def column(name):
+            a = arr[name]
+            if a.dtype.kind != "U": return a
+            a = a.astype(object)
+            if _NumPy.NULL + name in names: a[arr[_NumPy.NULL + name]] = np.nan
+            return a
+        index = pd.Index(column(_NumPy.INDEX))
+        cols = {c: column(c) for c in names if c != _NumPy.INDEX and not c.startswith(_NumPy.NULL)}
+        return pd.DataFrame(cols, index=index, copy=not readonly)
+    
+    @staticmethod
+    def write(df, f):
+        cols = [(_NumPy.INDEX, _NumPy._array(df.index))]
+        for c in df.columns:
+            values = df[c].values
+            cols.append((str(c), _NumPy._array(values)))
+            if cols[-1][1].dtype.kind == "U":
+                null = np.asarray(pd.isna(values), dtype=bool)
+                if null.any(): cols.append((_NumPy.NULL + str(c), null))
+        arr = np.empty(len(df), dtype=[(c, a.dtype) for c, a in cols])
+        for c, a in cols: arr[c] = a
+        np.save(f, arr)
+
+
+BACKENDS = {"csv": _CSV, "parquet": _Parquet, "feather": _Feather, "numpy": _NumPy}
+EXTENSIONS = {".csv": "csv", ".parquet": "parquet", ".feather": "feather", ".npy": "numpy"}
+
+
+def _backend(filename, backend=None):
+    """ the backend for filename (by its extension, unless backend is given)
+    """
+    if backend is None:
+        backend = EXTENSIONS.get(os.path.splitext(filename)[1].lower(), "csv")
+    if backend not in BACKENDS: raise ValueError("backend must be one of %s" % (tuple(BACKENDS),))
+    return BACKENDS[backend]
+
+
+def _jsonable(x):
+    """ converts numpy scalars (which json can not serialise) to python ones
+    """
+    if isinstance(x, np.generic): return x.item()
+    raise TypeError("can not serialise %r" % (x,))
+
+
 class PDataFrame ():
     """ persistant DataFrame
     
     creates a pandas.DataFrame object and links it to a location on the disk 
     from which it is initialised and where it is saved back
     
-    PDataFrame(filename, df)
-        filename - the filename where the object is stored (as csv)
+    PDataFrame(filename, df, journal, compact, backend, readonly)
+        filename - the filename where the object is stored
         df - if not none must be a DataFrame that is used to initialise the file
                 note that the file will be overwritten!
+        journal - if True, changes are appended to the log file filename.log
+                rather than rewriting the file every time (an existing log
+                is replayed in either mode, and cleared by every save)
+        compact - in journal mode, the number of changes after which the
+                file is rewritten and the log cleared
+        backend - the storage format, one of BACKENDS (default: chosen by
+                the extension of filename, see EXTENSIONS; csv otherwise)
+        readonly - if True, the frame can not be changed (and a NumPy file
+                is memory mapped rather than read)
+        cache - the number of rows get() keeps in its cache (0: none)
         
     DEPENDENCIES
     
@@ -64,17 +243,177 @@ class PDataFrame ():
     
     __version__ = "0.1a"
     
-    def __init__(self, filename, df=None):
+    def __init__(self, filename, df=None, journal=False, compact=10000, backend=None, readonly=False,
+                    cache=1024):
         
         self._filename = filename
+        self._backend = _backend(filename, backend)
+        self._readonly = readonly
+        self._journal = journal
+        self._compact = compact
+        self._log = None
+        self._logcount = 0
+        self._batch = None
+        self._dead = set()
+        self._cache = OrderedDict()
+        self._cachesize = cache
+        self._arrays = None
+        self._misses = 0
         
         if type(df) == type(None):
-            self._df = pd.read_csv(filename, index_col=0)    
+            self._df = self._backend.read(filename, readonly)
+            self._replay()
         else:
+            if readonly: raise ValueError("can not initialise a read only frame")
             self.reset(df)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+    
+    def _logname(self):
+        return self._filename + ".log"
+    
+    def _replay(self):
+        """ applies the changes recorded in the log (if any) to the frame
+        
+        this happens whether or not the frame is opened in journal mode, as
+        the log holds changes that are not in the file yet
+        
+        a last line that is incomplete (ie the process died while writing
+        it) is ignored, and cut off the log so that new changes are not
+        appended to it; replaying is idempotent, so it does not matter if the
+        file already contains some of the changes
+        """
+        if not os.path.exists(self._logname()): return
+        with open(self._logname(), "rb") as f:
+            lines = f.readlines()
+        if lines and not lines[-1].endswith(b"\n"):
+            lines.pop()
+            if not self._readonly:
+                with open(self._logname(), "r+b") as f:
+                    f.truncate(sum(len(line) for line in lines))
+        changes = []
+        for line in lines:
+            rec = json.loads(line)
+            if rec[0] == "batch": changes += rec[1]
+            else: changes.append(rec)
+        if not changes: return
+        if self._readonly: self._df = self._df.copy()
+        self._apply(changes)
+        self._logcount += len(changes)
+    
+    def _apply(self, changes):
+        """ applies a list of changes [op, key(, values)] to the frame in one
+        go (without persisting them)
+        
+        the changes are first reduced to the last one for every key; then the
+        deleted rows are dropped, the existing rows overwritten and the new
+        rows appended, each in a single operation (the result, including the
+        order of the rows, is the same as applying the changes one by one)
+        """
+        final = {}
+        deleted = set()
+        for change in changes:
+            op, key = change[0], change[1]
+            if op == "set":
+                if key in final and final[key] is None: del final[key]
+                final[key] = tuple(change[2])
+            elif op == "delete":
+                final.pop(key, None)
+                final[key] = None
+                deleted.add(key)
+            else: raise ValueError("unknown change: %s" % op)
+        
+        self._purge()
+        if deleted: self._df = self._df.drop(list(deleted), errors="ignore")
+        keys = [k for k, v in final.items() if v is not None]
+        self._touch(final)
+        if not keys: return
+        rows = pd.DataFrame([final[k] for k in keys], index=keys, columns=self._df.columns)
+        exists = rows.index.isin(self._df.index)
+        if exists.any(): self._df.loc[rows.index[exists]] = rows[exists].values
+        if exists.all(): return
+        new = rows[~exists]
+        self._df = pd.concat([self._df, new]) if len(self._df) else new
+    
+    def _record(self, changes):
+        """ persists changes that have been applied to the frame: appends them
+        to the log in journal mode (compacting it when it gets too long), and
+        rewrites the file otherwise
+        
+        the changes are written as one line (several as ["batch", changes]),
+        so that a line torn by a crash drops all of them, never only some
+        """
+        if not self._journal: return self.save()
+        if self._log is None: self._log = open(self._logname(), "a")
+        changes = [[c[0], c[1], list(c[2])] if len(c) == 3 else list(c) for c in changes]
+        rec = changes[0] if len(changes) == 1 else ["batch", changes]
+        self._log.write(json.dumps(rec, default=_jsonable) + "\n")
+        self._log.flush()
+        self._logcount += len(changes)
+        if self._logcount >= self._compact: self.save()
+    
+    def _writable(self):
+        if self._readonly: raise ValueError("%s is opened read only" % self._filename)
+    
+    def _change(self, change):
+        """ applies and persists one change (or buffers it in a batch)
+        """
+        self._writable()
+        if self._batch is not None: return self._batch.append(change)
+        if change[0] == "set":
+            if change[1] in self._dead: self._purge()
+            self._df.loc[change[1]] = change[2]
+            self._touch([change[1]])
+        else: self._delete(change[1])
+        self._record([change])
+    
+    @contextmanager
+    def batch(self):
+        """ context manager that buffers all sets and deletes in its block, and
+        applies and persists them together at its end
+        
+        the changes are not visible (eg to get) before the end of the block;
+        if the block raises an exception they are discarded; nested batches
+        are part of the outermost one
+        """
+        if self._batch is not None:
+            yield self
+            return
+        self._batch = []
+        try:
+            yield self
+        except BaseException:
+            self._batch = None
+            raise
+        changes, self._batch = self._batch, None
+        if not changes: return
+        self._apply(changes)
+        self._record(changes)
+    
+    def set_many(self, rows):
+        """ sets many rows in one batch (see batch)
+        
+        rows - a dict key -> values, or an iterable of (key, values) pairs
+        """
+        if isinstance(rows, dict): rows = rows.items()
+        with self.batch():
+            for key, values in rows: self.set(key, values)
+    
+    def close(self):
+        """ persists all changes (if the log holds any: rewrites the file and
+        clears the log)
+        """
+        if self._logcount and not self._readonly: self.save()
+        if self._log is not None:
+            self._log.close()
+            self._log = None
  
     @staticmethod
-    def create(filename, columns):
+    def create(filename, columns, backend=None):
         """ creates an empty frame based on the field names in columns and saves it
         
         note that the file is overwritten if it exists
@@ -84,18 +423,47 @@ class PDataFrame ():
             pdf = PDataFrame("new.csv")
         """
         df = pd.DataFrame(columns=columns)
-        df.to_csv(filename, index=True)
+        PDataFrame._write(df, filename, _backend(filename, backend))
+    
+    @staticmethod
+    def _write(df, filename, backend):
+        """ writes df to filename via a temporary file (synced to the disk
+        before it replaces filename), so that filename is never left half
+        written
+        """
+        tmp = filename + ".tmp"
+        try:
+            with open(tmp, "wb") as f:
+                backend.write(df, f)
+                f.flush()
+                os.fsync(f.fileno())
+        except BaseException:
+            if os.path.exists(tmp): os.remove(tmp)
+            raise
+        os.replace(tmp, filename)
         
         
     def save(self):
-        """ save the DataFrame to its location
+        """ save the DataFrame to its location (the log is cleared once the
+        file is written, as the file now contains its changes)
         """
-        self._df.to_csv(self._filename, index=True)
+        self._writable()
+        self._purge()
+        self._write(self._df, self._filename, self._backend)
+        if self._journal:
+            if self._log is not None: self._log.close()
+            self._log = open(self._logname(), "w")
+        elif os.path.exists(self._logname()):
+            os.remove(self._logname())
+        self._logcount = 0
       
     def reset(self, df):
         """ reset the DataFrame to df and save it
         """
+        self._writable()
         self._df = df.copy()
+        self._dead = set()
+        self._touch()
         self.save()
         
     def set(self, key, values):
@@ -103,11 +471,15 @@ class PDataFrame ():
         
         key - the key identifying the row; if this key exists the row in question
                 will be overwritten, otherwise it appends a new one
-        values - a tuple of values (must coincide with the number of fields)
+        values - a tuple of values (must coincide with the number of fields; a
+                single value for a frame with one field)
         
         """
-        self._df.loc[key] = values
-        self.save()
+        if isinstance(values, (str, bytes)) or not np.iterable(values): values = [values]
+        values = list(values)
+        if len(values) != len(self._df.columns):
+            raise ValueError("need %d values, got %d" % (len(self._df.columns), len(values)))
+        self._change(["set", key, values])
         
     def get(self, key, field=None, asDict=True):
         """ gets a row in the dataframe
@@ -115,28 +487,113 @@ class PDataFrame ():
         field - if not None, only return the value of this particular field
         asDict - if True, returns it as dict (otherwise a pandas series; ignored if field != None)
         """
+        if key in self._dead: raise KeyError(key)
         if not asDict: return self._df.loc[key]
-        d = dict(self._df.loc[key])
-        if field == None: return d
+        d = self._cache.get(key)
+        if d is None: d = self._row(key)
+        else: self._cache.move_to_end(key)
+        if field == None: return dict(d)
         return d[field]
+    
+    def _row(self, key):
+        """ the row key as dict (and cached)
+        
+        the row is read from the columns as numpy arrays; after a change of
+        the frame, rows are read value by value until there have been enough
+        of them to pay for getting the arrays again (which takes O(rows))
+        """
+        i = self._df.index.get_loc(key)
+        if not isinstance(i, (int, np.integer)): return dict(self._df.loc[key])
+        if self._arrays is None:
+            self._misses += 1
+            if 100 * self._misses >= len(self._df.index):
+                self._arrays = [(c, self._df[c].to_numpy()) for c in self._df.columns]
+        if self._arrays is None:
+            d = {c: self._df.iat[i, j] for j, c in enumerate(self._df.columns)}
+        else:
+            d = {c: a[i] for c, a in self._arrays}
+        if self._cachesize > 0:
+            self._cache[key] = d
+            if len(self._cache) > self._cachesize: self._cache.popitem(last=False)
+        return d
+    
+    def _touch(self, keys=None):
+        """ drops the cached rows keys (all if None), after they changed
+        """
+        self._arrays = None
+        self._misses = 0
+        if keys is None: self._cache.clear()
+        else:
+            for k in keys: self._cache.pop(k, None)
+    
+    def get_many(self, keys, asDict=True):
+        """ gets many rows in one lookup
+        
+        keys - a list of keys
+        asDict - if True, returns a dict key -> row as dict (otherwise a
+                pandas DataFrame); the values are of the same types as those
+                returned by get (ie numpy scalars for numeric columns)
+        
+        the rows are read from the frame directly, ie the row cache of get is
+        neither used nor filled
+        """
+        keys = list(keys)
+        for k in keys:
+            if k in self._dead: raise KeyError(k)
+        rows = self._df.loc[keys]
+        if not asDict: return rows
+        cols = [(c, rows[c].to_numpy()) for c in rows.columns]
+        return {k: {c: a[i] for c, a in cols} for i, k in enumerate(keys)}
         
    
     def delete(self, idx):
         """deletes one row from the dataframe, based on the index value
         
-        idx - the row to be deleted
+        idx - the row to be deleted (nothing happens if it does not exist)
+        
+        the row is only marked as deleted, which takes constant time; but
+        unless the frame is in journal mode, every change rewrites the whole
+        file, so that a delete is still O(rows) - use journal=True (or
+        delete_many) for deleting rows one by one from large frames
         """
+        self._change(["delete", idx])
+    
+    def delete_many(self, idxs):
+        """ deletes many rows in one batch (see batch), ie with one drop and
+        one save (or one write to the log in journal mode)
         
-        self._df.loc[idx] = np.nan
-        self._df = self._df.dropna()
-        self.save()
+        idxs - an iterable of index values
+        """
+        with self.batch():
+            for idx in idxs: self.delete(idx)
+    
+    def _delete(self, idx):
+        """ marks the row idx as deleted (purging the deleted rows once they
+        make up a quarter of the frame)
+        """
+        if idx in self._dead or idx not in self._df.index: return
+        self._dead.add(idx)
+        self._cache.pop(idx, None)
+        if 4 * len(self._dead) >= len(self._df.index): self._purge()
+    
+    def _purge(self):
+        """ removes the rows marked as deleted from the frame
+        """
+        if not self._dead: return
+        self._df = self._df.drop(list(self._dead))
+        self._dead = set()
+        self._arrays = None
+        self._misses = 0
         
     def length(self):
         """ returns the length of the dataframe
         """
-        return len(self._df.index)
+        return len(self._df.index) - len(self._dead)
     
     def df(self):
-        """ accessor function for the DataFrame object
+        """ accessor function for the DataFrame object (the cache of get is
+        cleared, as the frame may be changed through it)
         """
+        self._purge()
+        self._touch()
         return self._df
\ No newline at end of file
@@ -0,0 +1,160 @@
+"""
+PDataFrame Benchmarks
+
+
+benchmarks for the PDataFrame module; run as a script to print the results
+
+    python PDataFrameBenchmark.py
+
+delete_cost - time per delete as the store grows, for the current delete
+    (rows marked as deleted, purged in bulk) in journal mode, and for the
+    former one (row set to NaN, dropna over the whole frame) for reference;
+    without journal mode every delete rewrites the file, so it stays O(rows)
+get_cost - time per get of a hot set of keys, with and without the row
+    cache, against the former get (dict of the .loc row), and per row of
+    get_many
+
+
+DEPENDENCIES
+
+PDataFrame
+pandas
+numpy
+tempfile
+
+
+AUTHOR AND COPYRIGHT
+
+Copyright (c) 2014
+Stefan LOESCH, oditorium
+http://www.oditorium.com
+
+
+IMPORTANT LEGAL INFORMATION
+
+This software is distributed WITHOUT ANY WARRANTY and without even the
+implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE,
+and it does NOT CONSTITUTE INVESTMENT ADVICE. It shall not be used for
+other than academic purposes, and in particular IT SHOULD NOT BE RELIED
+UPON TO PRICE OR RISK MANAGE ACTUAL PORTFOLIOS.
+
+This software is licensed under the Gnu AGPL v3.0. See the LICENSE file
+or see http://www.gnu.org/licenses/
+
+"""
+
+__version__ = "0.1a"
+
+#-----------------------------------------------------------------------------
+#  Copyright (c) 2014  Stefan LOESCH, oditorium
+#
+#  Distributed under the terms of the AGPL License.
+#
+#  The full license is in the file LICENSE, distributed with this software.
+#-----------------------------------------------------------------------------
+
+import os
+import time
+import tempfile
+import numpy as np
+import pandas as pd
+from PDataFrame import PDataFrame
+
+SIZES = (1000, 10000, 100000, 1000000)
+
+
+def frame(n, cols=4):
+    """ a frame of n rows of random floats, with string keys
+    """
+    data = np.random.default_rng(1).random((n, cols))
+    return pd.DataFrame(data, index=["k%d" % i for i in range(n)],
+                            columns=["c%d" % j for j in range(cols)])
+
+
+def _legacy_delete(df, idx):
+    """ the former delete, without the save
+    """
+    df.loc[idx] = np.nan
+    return df.dropna()
+
+
+def delete_cost(sizes=SIZES, deletes=200, backend="numpy"):
+    """ time per delete (in seconds) for stores of the given sizes
+
+    deletes - the number of rows deleted (spread over the store); the
+                hash table of the index is built before the timing starts
+    backend - the storage backend of the stores
+
+    RETURNS
+        list of dicts with size, delete (journal mode), close (the purge and
+        save at the end, per delete) and legacy (the former delete on the
+        frame alone, ie without the save it also did)
+    """
+    res = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            df = frame(n)
+            keys = list(df.index[::max(n // deletes, 1)][:deletes])
+            filename = os.path.join(tmp, "bench%d.%s" % (n, "npy" if backend == "numpy" else backend))
+            PDataFrame(filename, df, backend=backend)
+            pdf = PDataFrame(filename, journal=True, backend=backend)
+            pdf.get(df.index[0])     # builds the hash table of the index
+
+            t = time.perf_counter()
+            for k in keys: pdf.delete(k)
+            delete = (time.perf_counter() - t) / len(keys)
+            t = time.perf_counter()
+            pdf.close()
+            close = (time.perf_counter() - t) / len(keys)
+
+            legacy_keys = keys[:max(len(keys) // 10, 1)]
+            t = time.perf_counter()
+            for k in legacy_keys: df = _legacy_delete(df, k)
+            legacy = (time.perf_counter() - t) / len(legacy_keys)
+
+            res.append({'size': n, 'delete': delete, 'close': close, 'legacy': legacy})
+    return res
+
+
+def get_cost(n=100000, hot=100, rounds=100):
+    """ time per get (in seconds) of a hot set of keys in a store of n rows
+
+    RETURNS
+        dict with cached (get, cache hits), uncached (get without cache),
+        legacy (the former get, ie dict(df.loc[key])) and get_many (per row)
+    """
+    df = frame(n)
+    df['name'] = ["n%d" % i for i in range(n)]
+    keys = list(np.random.default_rng(2).choice(df.index, hot))
+    res = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "bench.npy")
+        PDataFrame(filename, df)
+        for name, cache in (('uncached', 0), ('cached', 2 * hot)):
+            pdf = PDataFrame(filename, cache=cache)
+            for k in keys: pdf.get(k)
+            t = time.perf_counter()
+            for _ in range(rounds):
+                for k in keys: pdf.get(k)
+            res[name] = (time.perf_counter() - t) / (rounds * hot)
+        data = pdf.df()
+        t = time.perf_counter()
+        for k in keys: dict(data.loc[k])
+        res['legacy'] = (time.perf_counter() - t) / hot
+        t = time.perf_counter()
+        pdf.get_many(keys * rounds)
+        res['get_many'] = (time.perf_counter() - t) / (rounds * hot)
+    return res
+
+
+if __name__ == "__main__":
+
+    print("delete (journal mode)")
+    print("    %10s %14s %14s %14s" % ("rows", "delete (us)", "close (us)", "legacy (us)"))
+    for r in delete_cost():
+        print("    %10d %14.1f %14.1f %14.1f" % (r['size'], 1e6*r['delete'], 1e6*r['close'], 1e6*r['legacy']))
+    print()
+
+    print("get (100 hot keys, 100000 rows)")
+    for k, v in get_cost().items():
+        print("    %-10s %10.2f us" % (k, 1e6*v))
@@ -0,0 +1,235 @@
+"""
+Portfolio of Options
+
+
+a book of OptionPricing positions that is priced in vectorised groups
+
+the positions are grouped by product class (BSCall, BSPut, ...), and the
+parameters of each group (mat, strike, spot, notional etc) are held in
+columnar numpy arrays; every group is priced in one go by a single instance
+of its class with array valued parameters, and PV and Greeks are then
+aggregated by underlying
+
+adding or removing a position only touches its own group (appending to, or
+moving the last row into the freed slot of, its arrays)
+
+classes that can not be priced on arrays (eg MCEuropean, PDEPricing) can be
+held as well, but are priced one position at a time
+
+
+DEPENDENCIES
+
+Columnar
+numpy
+
+
+AUTHOR AND COPYRIGHT
+
+Copyright (c) 2014
+Stefan LOESCH, oditorium
+http://www.oditorium.com
+
+
+IMPORTANT LEGAL INFORMATION
+
+This software is distributed WITHOUT ANY WARRANTY and without even the
+implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE,
+and it does NOT CONSTITUTE INVESTMENT ADVICE. It shall not be used for
+other than academic purposes, and in particular IT SHOULD NOT BE RELIED
+UPON TO PRICE OR RISK MANAGE ACTUAL PORTFOLIOS.
+
+This software is licensed under the Gnu AGPL v3.0. See the LICENSE file
+or see http://www.gnu.org/licenses/
+
+"""
+
+__version__ = "0.1a"
+
+#-----------------------------------------------------------------------------
+#  Copyright (c) 2014  Stefan LOESCH, oditorium
+#
+#  Distributed under the terms of the AGPL License.
+#
+#  The full license is in the file LICENSE, distributed with this software.
+#-----------------------------------------------------------------------------
+
+import numpy as np
+from Columnar import Columnar
+
+MARKET = ('rate', 'yld', 'sig', 'spot', 'time')
+GREEKS = ('PV', 'Delta', 'DeltaCash', 'Gamma', 'GammaCash', 'Vega', 'Theta', 'Rho', 'RhoYld', 'Volga', 'Vanna')
+
+
+class _Group(Columnar):
+    """ the positions of one product class, as rows of a Columnar table
+    (id, underlying code, notional and the option parameters)
+    """
+
+    def __init__(self, cls, capacity=16):
+        Columnar.__init__(self, [('ids', 'i8'), ('under', 'i8'), ('notional', 'f8')], capacity)
+        self.cls = cls
+
+    def add(self, pid, under, notional, option):
+        """ appends a row, returns its slot
+        """
+        return self.append(option, ids=pid, under=under, notional=notional)
+
+    def remove(self, i):
+        """ removes the row in slot i by moving the last row into it
+
+        returns the id of the position that was moved (or None)
+        """
+        last = self.n - 1
+        moved = None if i == last else int(self.a['ids'][last])
+        Columnar.remove(self, i)
+        return moved
+
+    def option(self):
+        """ one instance of the class, with the group's columns as parameters
+        """
+        return Columnar.option(self, self.cls)
+
+    def values(self, greeks):
+        """ dict greek -> array of notional weighted values, one per position
+        (only PV, rather than all Greeks, is computed if that is all that is
+        asked for)
+        """
+        n = self.column('notional')
+        if tuple(greeks) == ('PV',): return {'PV': n * self.option().PV()}
+        r = self.option().risk()
+        return {g: n * r[g] for g in greeks}
+
+
+class _ObjectGroup:
+    """ the positions of a product class that can not be priced on arrays
+    """
+
+    def __init__(self, cls):
+        self.cls = cls
+        self.n = 0
+        self.ids = []
+        self.under = []
+        self.notional = []
+        self.objects = []
+
+    def add(self, pid, under, notional, option):
+        self.ids.append(pid)
+        self.under.append(under)
+        self.notional.append(notional)
+        self.objects.append(option)
+        self.n += 1
+        return self.n - 1
+
+    def remove(self, i):
+        moved = None
+        for l in (self.ids, self.under, self.notional, self.objects):
+            l[i] = l[-1]
+            l.pop()
+        if i < len(self.ids): moved = self.ids[i]
+        self.n -= 1
+        return moved
+
+    def values(self, greeks):
+        res = {g: np.zeros(self.n) for g in greeks}
+        for i, (o, n) in enumerate(zip(self.objects, self.notional)):
+            r = {'PV': o.PV()} if tuple(greeks) == ('PV',) else o.risk()
+            for g in greeks: res[g][i] = n * r[g]
+        return res
+
+
+class Portfolio:
+    """ a book of options, priced in vectorised groups by product class
+
+        book = Portfolio()
+        pid = book.add(BSCall(mat=1, strike=100, spot=100, sig=0.2), notional=10, underlying="SPX")
+        book.PV()
+        book.risk()             # {"SPX": {"PV": ..., "Delta": ..., ...}}
+        book.remove(pid)
+
+    the options added are not referenced by the portfolio (apart from those
+    of non vectorised classes); their parameters are copied into the columns
+    of their group
+    """
+
+    __version__ = "0.1a"
+
+    def __init__(self):
+        self._groups = {}
+        self._where = {}
+        self._names = []
+        self._codes = {}
+        self._next = 0
+
+    def _code(self, underlying):
+        if underlying not in self._codes:
+            self._codes[underlying] = len(self._names)
+            self._names.append(underlying)
+        return self._codes[underlying]
+
+    def add(self, option, notional=1.0, underlying=None):
+        """ adds a position, and returns its id
+
+        option - the OptionPricing instance (with scalar parameters)
+        notional - the number of units held
+        underlying - the key of the underlying (used for aggregating the risk)
+        """
+        cls = type(option)
+        group = self._groups.get(cls)
+        if group is None:
+            group = self._groups[cls] = _Group(cls) if cls.vectorised else _ObjectGroup(cls)
+        pid = self._next
+        self._next += 1
+        self._where[pid] = (group, group.add(pid, self._code(underlying), float(notional), option))
+        return pid
+
+    def remove(self, pid):
+        """ removes the position with id pid
+        """
+        group, slot = self._where.pop(pid)
+        moved = group.remove(slot)
+        if moved is not None: self._where[moved] = (group, slot)
+
+    def __len__(self):
+        return len(self._where)
+
+    def underlyings(self):
+        """ the underlyings that appear in the book
+        """
+        return list(self._names)
+
+    def set_market(self, underlying, **params):
+        """ sets market parameters for all positions on underlying
+
+        params - any of rate, yld, sig, spot, time, eg set_market("SPX", spot=4500)
+        """
+        code = self._codes[underlying]
+        for k in params:
+            if k not in MARKET: raise ValueError("not a market parameter: %s" % k)
+        for group in self._groups.values():
+            if isinstance(group, _Group):
+                mask = group.column('under') == code
+                for k, v in params.items(): group.column(k)[mask] = v
+            else:
+                for o, u in zip(group.objects, group.under):
+                    if u != code: continue
+                    for k, v in params.items(): setattr(o, k, float(v))
+
+    def risk(self, greeks=GREEKS):
+        """ PV and Greeks, aggregated by underlying
+
+        RETURNS
+            dict underlying -> dict greek -> notional weighted sum
+        """
+        m = len(self._names)
+        total = {g: np.zeros(m) for g in greeks}
+        for group in self._groups.values():
+            if group.n == 0: continue
+            under = group.column('under') if isinstance(group, _Group) else np.array(group.under)
+            for g, v in group.values(greeks).items():
+                total[g] += np.bincount(under, weights=v, minlength=m)
+        return {u: {g: float(total[g][i]) for g in greeks} for i, u in enumerate(self._names)}
+
+    def PV(self):
+        """ total PV of the book
+        """
+        return sum(r['PV'] for r in self.risk(greeks=('PV',)).values())
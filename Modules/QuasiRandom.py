@@ -0,0 +1,157 @@
+"""
+Quasi Random Numbers and Path Construction
+
+
+low discrepancy (Sobol) normals, and the construction of Brownian paths
+from them, for use in Monte Carlo pricing
+
+uniforms - points of a (scrambled) Sobol sequence
+normals - standard normals, ie the Sobol points mapped through N^-1
+paths - Brownian paths on a time grid, built from normals
+
+Sobol points fill the unit cube much more evenly than pseudo random numbers,
+so integration errors fall roughly like 1/N rather than 1/sqrt(N); but the
+first coordinates of the sequence are much better distributed than the later
+ones, so for paths the draws should be assigned to the time steps such that
+the first ones carry most of the variance - that is what the Brownian bridge
+(terminal value first, then the midpoints) and the PCA construction (the
+eigenvectors of the covariance matrix, largest eigenvalue first, as in the
+MonteCarlo3-EigenvectorsPCA notebook) do
+
+    z = normals(4096, 12, seed=1)
+    w = paths(z, times, construction="bridge")     # shape (4096, 12)
+
+the number of points should be a power of 2 (otherwise the first n points of
+the next power of 2 are used, which are not as evenly balanced)
+
+
+DEPENDENCIES
+
+numpy
+scipy
+
+
+AUTHOR AND COPYRIGHT
+
+Copyright (c) 2014
+Stefan LOESCH, oditorium
+http://www.oditorium.com
+
+
+IMPORTANT LEGAL INFORMATION
+
+This software is distributed WITHOUT ANY WARRANTY and without even the
+implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE,
+and it does NOT CONSTITUTE INVESTMENT ADVICE. It shall not be used for
+other than academic purposes, and in particular IT SHOULD NOT BE RELIED
+UPON TO PRICE OR RISK MANAGE ACTUAL PORTFOLIOS.
+
+This software is licensed under the Gnu AGPL v3.0. See the LICENSE file
+or see http://www.gnu.org/licenses/
+
+"""
+
+__version__ = "0.1a"
+
+#-----------------------------------------------------------------------------
+#  Copyright (c) 2014  Stefan LOESCH, oditorium
+#
+#  Distributed under the terms of the AGPL License.
+#
+#  The full license is in the file LICENSE, distributed with this software.
+#-----------------------------------------------------------------------------
+
+import numpy as np
+from scipy.stats import qmc
+from scipy.special import ndtri
+
+CONSTRUCTIONS = ('incremental', 'bridge', 'pca')
+
+
+def uniforms(n, d=1, seed=None, scramble=True):
+    """ the first n points of a d dimensional Sobol sequence, as (n x d) array
+
+    seed - seed (or numpy Generator) for the scrambling; different seeds
+            give independent randomisations of the same sequence
+    scramble - if False, the raw sequence is returned (which starts at 0)
+    """
+    m = max(int(n - 1).bit_length(), 0)
+    return qmc.Sobol(d, scramble=scramble, rng=seed).random_base2(m)[:n]
+
+
+def normals(n, d=1, seed=None, scramble=True):
+    """ n quasi random standard normal vectors of dimension d, as (n x d) array
+
+    the Sobol points (see uniforms) are mapped through the inverse normal
+    distribution function; points on the boundary of the cube (eg the origin
+    of the raw sequence) are moved inside by the resolution of the sequence
+    """
+    u = uniforms(n, d, seed=seed, scramble=scramble)
+    eps = 2.0**-53
+    return ndtri(np.clip(u, eps, 1.0 - eps))
+
+
+def _bridge_order(m):
+    """ the order in which the Brownian bridge fills the points 1..m
+
+    returns a list of (i, left, right): point i is drawn conditional on the
+    points left and right (0 is the start, where the path is 0, and right
+    is None for the terminal point)
+    """
+    order = [(m, 0, None)]
+    intervals = [(0, m)]
+    while intervals:
+        nxt = []
+        for left, right in intervals:
+            if right - left < 2: continue
+            mid = (left + right) // 2
+            order.append((mid, left, right))
+            nxt += [(left, mid), (mid, right)]
+        intervals = nxt
+    return order
+
+
+def paths(z, times, construction="bridge"):
+    """ Brownian paths at times, built from the normals z
+
+    PARAMETERS
+        z - array (n x m) of standard normals, one row per path (eg normals(n, m))
+        times - the m increasing times t_1..t_m (> 0) at which the paths are sampled
+        construction - how the normals are assigned to the path
+            incremental - z[:, j] drives the increment from t_{j-1} to t_j
+            bridge - z[:, 0] drives W(t_m), and the others the midpoints of the
+                        Brownian bridge between points already drawn
+            pca - z[:, j] multiplies the j-th principal component of the
+                        covariance matrix min(t_i, t_j) (largest first)
+
+    RETURNS
+        array (n x m) of the values W(t_j) of standard Brownian motions
+    """
+    z = np.atleast_2d(np.asarray(z, dtype=float))
+    t = np.asarray(times, dtype=float)
+    m = len(t)
+    if z.shape[1] != m: raise ValueError("need one normal per time step")
+
+    if construction == "incremental":
+        dt = np.diff(np.concatenate(([0.0], t)))
+        return np.cumsum(z * np.sqrt(dt), axis=1)
+
+    if construction == "pca":
+        cov = np.minimum.outer(t, t)
+        lam, vec = np.linalg.eigh(cov)
+        lam, vec = lam[::-1], vec[:, ::-1]
+        return np.dot(z, (vec * np.sqrt(np.maximum(lam, 0.0))).T)
+
+    if construction == "bridge":
+        tt = np.concatenate(([0.0], t))
+        w = np.zeros((z.shape[0], m + 1))
+        for k, (i, left, right) in enumerate(_bridge_order(m)):
+            if right is None:
+                w[:, i] = np.sqrt(tt[i]) * z[:, k]
+                continue
+            a = (tt[right] - tt[i]) / (tt[right] - tt[left])
+            var = (tt[i] - tt[left]) * a
+            w[:, i] = a * w[:, left] + (1.0 - a) * w[:, right] + np.sqrt(var) * z[:, k]
+        return w[:, 1:]
+
+    raise ValueError("construction must be one of %s" % (CONSTRUCTIONS,))
@@ -0,0 +1,323 @@
+"""
+Incremental Repricing on Market Ticks
+
+
+keeps a book of OptionPricing positions priced while the market data ticks
+
+every position subscribes its spot, rate, yld and sig to market data keys
+(eg spot="SPX", sig="SPX.vol"); a tick on a key only touches the positions
+subscribed to it, whose PV, Delta and Gamma are immediately re-estimated
+from their last exact valuation with a Taylor expansion
+
+    PV ~ PV0 + Delta0 dS + 1/2 Gamma0 dS^2 + (Vega0 dsig + Rho0 dr + RhoYld0 dy) / 0.01
+    Delta ~ Delta0 + Gamma0 dS + Vanna0 dsig
+
+(a handful of vectorised operations on the affected positions); the ticked
+positions are marked dirty, and an exact reprice of the dirty positions (one
+vectorised risk() call per product class) runs in a background thread,
+which replaces the estimates when it is done
+
+    pricer = TickPricer()
+    pid = pricer.add(BSCall(mat=1, strike=100, spot=100, sig=0.2), notional=10,
+                        spot="SPX", sig="SPX.vol")
+    pricer.tick("SPX", 101.5)       # estimates updated, exact reprice queued
+    pricer.PV("SPX"), pricer.Delta("SPX")
+    pricer.wait()                   # wait for the exact values
+
+the positions must be of classes that can be priced on arrays (vectorised)
+
+
+DEPENDENCIES
+
+Columnar
+numpy
+threading
+concurrent.futures
+
+
+AUTHOR AND COPYRIGHT
+
+Copyright (c) 2014
+Stefan LOESCH, oditorium
+http://www.oditorium.com
+
+
+IMPORTANT LEGAL INFORMATION
+
+This software is distributed WITHOUT ANY WARRANTY and without even the
+implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE,
+and it does NOT CONSTITUTE INVESTMENT ADVICE. It shall not be used for
+other than academic purposes, and in particular IT SHOULD NOT BE RELIED
+UPON TO PRICE OR RISK MANAGE ACTUAL PORTFOLIOS.
+
+This software is licensed under the Gnu AGPL v3.0. See the LICENSE file
+or see http://www.gnu.org/licenses/
+
+"""
+
+__version__ = "0.1a"
+
+#-----------------------------------------------------------------------------
+#  Copyright (c) 2014  Stefan LOESCH, oditorium
+#
+#  Distributed under the terms of the AGPL License.
+#
+#  The full license is in the file LICENSE, distributed with this software.
+#-----------------------------------------------------------------------------
+
+import threading
+from copy import copy
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from Columnar import Columnar
+
+MARKET = ('spot', 'rate', 'yld', 'sig')
+EXACT = ('PV', 'Delta', 'Gamma', 'Vega', 'Rho', 'RhoYld', 'Vanna')
+ESTIMATED = ('PV', 'Delta', 'Gamma')
+
+
+class _Book(Columnar):
+    """ the positions of one product class, as rows of a Columnar table
+
+    mat, strike, ... - the current inputs of every position (the parameters)
+    base_<param> - the market inputs at the last exact valuation (MARKET)
+    exact_<greek> - the values at the last exact valuation (EXACT)
+    est_<greek> - the current estimates of PV, Delta, Gamma
+    version - incremented on every change of the inputs of a position
+    """
+
+    def __init__(self, cls, capacity=16):
+        fields = ([('ids', 'i8'), ('notional', 'f8'), ('version', 'i8'), ('dirty', '?')]
+                    + [('base_' + c, 'f8') for c in MARKET]
+                    + [('exact_' + g, 'f8') for g in EXACT]
+                    + [('est_' + g, 'f8') for g in ESTIMATED])
+        Columnar.__init__(self, fields, capacity)
+        self.cls = cls
+        self.keys = {c: [] for c in MARKET}
+
+    def add(self, pid, notional, option, keys):
+        """ appends a position (not yet valued, ie dirty), returns its slot
+        """
+        for c in MARKET: self.keys[c].append(keys[c])
+        return self.append(option, ids=pid, notional=notional, dirty=True)
+
+    def estimate(self, idx):
+        """ re-estimates PV, Delta, Gamma of the positions idx from their last
+        exact values and the change of their inputs since
+        """
+        a = self.a
+        def dx(c): return a[c][idx] - a['base_' + c][idx]
+        def e(g): return a['exact_' + g][idx]
+        ds = dx('spot')
+        dsig = dx('sig') / 0.01
+        gamma = e('Gamma')
+        a['est_PV'][idx] = (e('PV') + ds * (e('Delta') + 0.5 * gamma * ds)
+                                + e('Vega') * dsig
+                                + e('Rho') * dx('rate') / 0.01
+                                + e('RhoYld') * dx('yld') / 0.01)
+        a['est_Delta'][idx] = e('Delta') + gamma * ds + 0.01 * e('Vanna') * dsig
+        a['est_Gamma'][idx] = gamma
+
+
+class TickPricer:
+    """ a book of options that is repriced incrementally on market data ticks
+
+    background - if True (default) the exact reprices run in a background
+                    thread, otherwise they only happen when reprice() is called
+    """
+
+    __version__ = "0.1a"
+
+    def __init__(self, background=True):
+        self._books = {}
+        self._where = {}
+        self._market = {}
+        self._subs = {}
+        self._stale = False
+        self._next = 0
+        self._lock = threading.RLock()
+        self._pool = ThreadPoolExecutor(max_workers=1) if background else None
+        self._pending = None
+        self._again = False
+
+    def add(self, option, notional=1.0, spot=None, rate=None, yld=None, sig=None):
+        """ adds a position, and returns its id
+
+        option - the OptionPricing instance (with scalar parameters)
+        notional - the number of units held
+        spot, rate, yld, sig - the market data keys the parameters subscribe
+                    to (None: the parameter is fixed at its value in option);
+                    if a key already has a market value, that is used
+                    instead of the value in option
+
+        the position is valued by the next exact reprice
+        """
+        cls = type(option)
+        if not cls.vectorised: raise TypeError("%s can not be priced on arrays" % cls.__name__)
+        keys = {'spot': spot, 'rate': rate, 'yld': yld, 'sig': sig}
+        with self._lock:
+            option = copy(option)
+            for c, k in keys.items():
+                if k is None: continue
+                if k in self._market: setattr(option, c, self._market[k])
+                else: self._market[k] = float(getattr(option, c))
+            book = self._books.get(cls)
+            if book is None: book = self._books[cls] = _Book(cls)
+            pid = self._next
+            self._next += 1
+            self._where[pid] = (book, book.add(pid, float(notional), option, keys))
+            self._stale = True
+        self._schedule()
+        return pid
+
+    def __len__(self):
+        return len(self._where)
+
+    def _subscriptions(self):
+        """ key -> list of (book, param, slots), rebuilt after positions were added
+
+        the slots are a slice where they are contiguous (eg all positions of
+        a book), as slices index without copying
+        """
+        if self._stale:
+            subs = {}
+            for book in self._books.values():
+                for c in MARKET:
+                    keys = np.array(book.keys[c], dtype=object)
+                    for k in set(book.keys[c]):
+                        if k is None: continue
+                        idx = np.flatnonzero(keys == k)
+                        if idx[-1] - idx[0] == len(idx) - 1: idx = slice(idx[0], idx[-1] + 1)
+                        subs.setdefault(k, []).append((book, c, idx))
+            self._subs = subs
+            self._stale = False
+        return self._subs
+
+    def tick(self, key, value):
+        """ sets the market value of key, and re-estimates the positions that
+        subscribe to it; their exact reprice is queued
+        """
+        with self._lock:
+            self._market[key] = value
+            for book, c, idx in self._subscriptions().get(key, ()):
+                book.a[c][idx] = value
+                book.a['version'][idx] += 1
+                book.a['dirty'][idx] = True
+                book.estimate(idx)
+        self._schedule()
+
+    def ticks(self, values):
+        """ applies a dict of ticks key -> value
+        """
+        for k, v in values.items(): self.tick(k, v)
+
+    def market(self, key):
+        """ the current market value of key
+        """
+        return self._market[key]
+
+    def reprice(self):
+        """ reprices all dirty positions exactly (one vectorised call per
+        product class), and returns the number of positions repriced
+
+        the inputs are read at the start; positions that tick while the
+        valuation runs stay dirty, and get an estimate relative to the new
+        exact values
+        """
+        count = 0
+        for book in list(self._books.values()):
+            with self._lock:
+                idx = np.flatnonzero(book.column('dirty'))
+                if len(idx) == 0: continue
+                rows = book.a[idx]
+            res = book.cls(**{p: rows[p] for p in book.params}).risk()
+            with self._lock:
+                for c in MARKET: book.a['base_' + c][idx] = rows[c]
+                for g in EXACT: book.a['exact_' + g][idx] = res[g]
+                book.a['dirty'][idx] = book.a['version'][idx] != rows['version']
+                book.estimate(idx)
+            count += len(idx)
+        return count
+
+    def _schedule(self):
+        """ requests a background reprice (starting one if none is running)
+        """
+        if self._pool is None: return
+        with self._lock:
+            self._again = True
+            if self._pending is None: self._pending = self._pool.submit(self._drain)
+
+    def _drain(self):
+        """ the background job: reprices until no more requests come in
+        """
+        try:
+            while True:
+                with self._lock:
+                    if not self._again:
+                        self._pending = None
+                        return
+                    self._again = False
+                while self.reprice(): pass
+        except BaseException:
+            with self._lock: self._pending = None
+            raise
+
+    def wait(self):
+        """ waits until no exact reprice is pending (or runs it, without a
+        background thread)
+        """
+        if self._pool is None:
+            self.reprice()
+            return
+        while True:
+            with self._lock: pending = self._pending
+            if pending is None: return
+            pending.result()
+
+    def close(self):
+        """ stops the background thread (after the pending reprice)
+        """
+        if self._pool is not None: self._pool.shutdown()
+
+    def is_exact(self):
+        """ True if all positions are valued exactly at the current inputs
+        """
+        with self._lock:
+            return not any(b.column('dirty').any() for b in self._books.values())
+
+    def _total(self, greek, key):
+        total = 0.0
+        with self._lock:
+            if key is None:
+                for book in self._books.values():
+                    total += float(np.dot(book.column('notional'), book.column('est_' + greek)))
+                return total
+            for book, c, idx in self._subscriptions().get(key, ()):
+                if c == 'spot': total += float(np.dot(book.a['notional'][idx], book.a['est_' + greek][idx]))
+        return total
+
+    def PV(self, key=None):
+        """ the (estimated) PV of all positions whose spot subscribes to key
+        (all positions if key is None)
+        """
+        return self._total('PV', key)
+
+    def Delta(self, key=None):
+        """ the (estimated) Delta of the positions on key (see PV)
+        """
+        return self._total('Delta', key)
+
+    def Gamma(self, key=None):
+        """ the Gamma of the positions on key, as of the last exact reprice (see PV)
+        """
+        return self._total('Gamma', key)
+
+    def position(self, pid):
+        """ the (estimated) PV, Delta and Gamma of one position, per unit,
+        and whether they are exact
+        """
+        with self._lock:
+            book, i = self._where[pid]
+            res = {g: float(book.a['est_' + g][i]) for g in ESTIMATED}
+            res['exact'] = not book.a['dirty'][i]
+        return res
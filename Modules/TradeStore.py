@@ -0,0 +1,191 @@
+"""
+Compact Trade Store
+
+
+stores the parameters of a book of Black-Scholes type trades in one numpy
+structured array (one row of 9 numbers, ie 72 bytes, per trade) rather than
+as one OptionPricing object per trade (with a __dict__ of Python floats)
+
+the store can be saved as a .npy file and opened memory mapped, so that
+several risk workers can share one read-only book without each loading
+or copying it
+
+TradeStore - the store itself
+TradeView - lightweight view of one row, exposing the OptionPricing API
+
+    store = TradeStore()
+    store.append(BSCall(mat=1, strike=100, spot=100, sig=0.2), notional=10)
+    store.save("book.npy")
+
+    book = TradeStore.load("book.npy")      # memory mapped, read only
+    book.PV()                               # array, one PV per trade
+    book[0].Delta()                         # a single trade
+
+
+DEPENDENCIES
+
+OptionPricing
+Columnar
+numpy
+
+
+AUTHOR AND COPYRIGHT
+
+Copyright (c) 2014
+Stefan LOESCH, oditorium
+http://www.oditorium.com
+
+
+IMPORTANT LEGAL INFORMATION
+
+This software is distributed WITHOUT ANY WARRANTY and without even the
+implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE,
+and it does NOT CONSTITUTE INVESTMENT ADVICE. It shall not be used for
+other than academic purposes, and in particular IT SHOULD NOT BE RELIED
+UPON TO PRICE OR RISK MANAGE ACTUAL PORTFOLIOS.
+
+This software is licensed under the Gnu AGPL v3.0. See the LICENSE file
+or see http://www.gnu.org/licenses/
+
+"""
+
+__version__ = "0.1a"
+
+#-----------------------------------------------------------------------------
+#  Copyright (c) 2014  Stefan LOESCH, oditorium
+#
+#  Distributed under the terms of the AGPL License.
+#
+#  The full license is in the file LICENSE, distributed with this software.
+#-----------------------------------------------------------------------------
+
+import numpy as np
+import OptionPricing as op
+from Columnar import Columnar, PARAMS
+
+# the product classes that can be stored; the position in this tuple is the
+# `kind` code saved in the store, so new classes must be appended at the end
+KINDS = (op.Forward, op.BSCall, op.BSPut, op.BSDCall, op.BSDPut, op.BSRDCall, op.BSRDPut)
+
+FIELDS = [('kind', 'i8'), ('notional', 'f8')]
+DTYPE = np.dtype(FIELDS + [(p, 'f8') for p in PARAMS])
+
+
+class TradeView:
+    """ lightweight view of one trade in a TradeStore
+
+    the fields (kind, notional, mat, strike, ...) are read from the store,
+    and all other attributes (PV, Delta, risk, ...) are those of the
+    corresponding OptionPricing instance, which is created on the fly
+    """
+
+    __slots__ = ('_store', '_i')
+
+    def __init__(self, store, i):
+        self._store = store
+        self._i = i
+
+    def __getattr__(self, name):
+        row = self._store.a[self._i]
+        if name in DTYPE.names: return row[name].item()
+        return getattr(self.option(), name)
+
+    def option(self):
+        """ the OptionPricing instance for this trade
+        """
+        row = self._store.a[self._i]
+        return KINDS[row['kind']](**{p: row[p].item() for p in PARAMS})
+
+    def __repr__(self):
+        return "<TradeView %d: %s>" % (self._i, KINDS[self.kind].__name__)
+
+
+class TradeStore(Columnar):
+    """ compact store of trades, backed by a numpy structured array (the rows
+    of a Columnar table)
+
+    TradeStore(capacity) - creates an empty store
+    TradeStore.load(filename) - opens a saved store (memory mapped by default)
+    """
+
+    __version__ = "0.1a"
+
+    def __init__(self, capacity=16, array=None):
+        Columnar.__init__(self, FIELDS, capacity, array)
+
+    @classmethod
+    def load(cls, filename, mmap=True):
+        """ opens a store saved with save; if mmap is True, the file is memory
+        mapped read-only (and the store can not be appended to)
+        """
+        a = np.load(filename, mmap_mode='r' if mmap else None)
+        return cls(array=a)
+
+    def save(self, filename):
+        """ saves the store as a .npy file
+        """
+        np.save(filename, self.rows())
+
+    def append(self, option, notional=1.0):
+        """ appends a trade, and returns its index
+
+        option - an instance of one of the classes in KINDS (with scalar parameters)
+        notional - the number of units held
+        """
+        return Columnar.append(self, option, kind=KINDS.index(type(option)), notional=notional)
+
+    def __getitem__(self, i):
+        if i < 0: i += self.n
+        if not 0 <= i < self.n: raise IndexError(i)
+        return TradeView(self, i)
+
+    def __iter__(self):
+        return (TradeView(self, i) for i in range(self.n))
+
+    def nbytes(self):
+        """ memory used by the trades (in bytes)
+        """
+        return self.n * DTYPE.itemsize
+
+    def apply(self, method, weighted=False):
+        """ evaluates method (eg "PV", "Delta") on all trades
+
+        the trades are priced in one vectorised call per kind; if weighted is
+        True the results are multiplied by the notionals
+
+        RETURNS
+            array with one value per trade
+        """
+        a = self.rows()
+        out = np.empty(self.n)
+        kinds = a['kind']
+        for k, cls in enumerate(KINDS):
+            idx = np.flatnonzero(kinds == k)
+            if len(idx) == 0: continue
+            rows = a[idx]
+            out[idx] = getattr(cls(**{p: rows[p] for p in PARAMS}), method)()
+        if weighted: out *= a['notional']
+        return out
+
+    def PV(self, weighted=False):
+        """ the PVs of all trades (see apply)
+        """
+        return self.apply('PV', weighted=weighted)
+
+    def risk(self, weighted=False):
+        """ PV and all Greeks of all trades, as dict greek -> array (see apply
+        and OptionPricing.risk)
+        """
+        a = self.rows()
+        kinds = a['kind']
+        out = {}
+        for k, cls in enumerate(KINDS):
+            idx = np.flatnonzero(kinds == k)
+            if len(idx) == 0: continue
+            rows = a[idx]
+            for g, v in cls(**{p: rows[p] for p in PARAMS}).risk().items():
+                if g not in out: out[g] = np.empty(self.n)
+                out[g][idx] = v
+        if weighted:
+            for v in out.values(): v *= a['notional']
+        return out
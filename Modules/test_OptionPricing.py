@@ -0,0 +1,141 @@
+"""
+Tests for OptionPricing
+
+
+checks the adjoint gradient (OptionPricing.gradient) against the finite
+difference Greeks, ie against Delta, Vega, Rho and RhoYld computed by
+bumping (analytic = False), for flat parameters, array parameters and term
+structures (Curve, VolCurve), and the curve entries against RhoBuckets and
+VegaBuckets; run with
+
+    python -m pytest test_OptionPricing.py
+
+
+DEPENDENCIES
+
+OptionPricing
+numpy
+pytest
+copy
+
+
+AUTHOR AND COPYRIGHT
+
+Copyright (c) 2014
+Stefan LOESCH, oditorium
+http://www.oditorium.com
+
+
+IMPORTANT LEGAL INFORMATION
+
+This software is distributed WITHOUT ANY WARRANTY and without even the
+implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE,
+and it does NOT CONSTITUTE INVESTMENT ADVICE. It shall not be used for
+other than academic purposes, and in particular IT SHOULD NOT BE RELIED
+UPON TO PRICE OR RISK MANAGE ACTUAL PORTFOLIOS.
+
+This software is licensed under the Gnu AGPL v3.0. See the LICENSE file
+or see http://www.gnu.org/licenses/
+
+"""
+
+__version__ = "0.1a"
+
+#-----------------------------------------------------------------------------
+#  Copyright (c) 2014  Stefan LOESCH, oditorium
+#
+#  Distributed under the terms of the AGPL License.
+#
+#  The full license is in the file LICENSE, distributed with this software.
+#-----------------------------------------------------------------------------
+
+from copy import copy
+import numpy as np
+import pytest
+import OptionPricing as op
+
+CLASSES = (op.BSCall, op.BSPut, op.BSDCall, op.BSDPut, op.BSRDCall, op.BSRDPut)
+
+# the bumped Greeks are finite differences (Vega, Rho and RhoYld one sided,
+# with bumps of one point), so they only agree to about their second order term;
+# for Vega, whose second order term can be large (eg for digitals), that term
+# is taken out using the bumped Volga, ie Vega - Volga/2 = (PV(sig+) - PV(sig-))/2
+RTOL = 0.03
+ATOL = 1e-3
+
+
+def bumped(opt):
+    """ a copy of opt that computes its Greeks by bumping
+    """
+    opt = copy(opt)
+    opt.analytic = False
+    return opt
+
+
+def check(opt):
+    """ asserts that the gradient of opt agrees with its bumped Greeks, and
+    with its closed form ones (to rounding)
+
+    the gradient of a curve is summed over its buckets (a parallel shift),
+    and the Greeks with respect to a scalar that is broadcast against arrays
+    are summed over the positions (as the gradient is); the closed form Vega
+    of a VolCurve is the sensitivity to the effective vol rather than to a
+    parallel shift of the curve, so it is not compared
+    """
+    g = opt.gradient()
+    b = bumped(opt)
+    for key, greek, scale in (('spot', 'Delta', 1.0), ('sig', 'Vega', 0.01),
+                                ('rate', 'Rho', 0.01), ('yld', 'RhoYld', 0.01)):
+        param = getattr(opt, key)
+        curve = isinstance(param, op.Curve)
+        adj = scale * (np.sum(g[key], axis=0) if curve else g[key])
+        def total(x): return np.sum(x) if np.ndim(adj) == 0 else x
+        fd = b.Vega() - 0.5 * b.Volga() if greek == 'Vega' else getattr(b, greek)()
+        np.testing.assert_allclose(adj, total(fd), rtol=RTOL, atol=ATOL, err_msg=greek)
+        if curve and key == 'sig': continue
+        np.testing.assert_allclose(adj, total(getattr(opt, greek)()), rtol=1e-8, atol=1e-10, err_msg=greek)
+
+
+@pytest.mark.parametrize("cls", CLASSES)
+def test_flat(cls):
+    check(cls(mat=1.5, strike=105, spot=100, rate=0.04, yld=0.01, sig=0.25))
+
+
+@pytest.mark.parametrize("cls", CLASSES)
+def test_arrays(cls):
+    check(cls(mat=np.array([0.5, 1.0, 2.0]), strike=np.array([90.0, 100.0, 110.0]),
+                spot=np.array([100.0, 108.0, 100.0]), rate=0.03, yld=0.01,
+                sig=np.array([0.25, 0.3, 0.35])))
+
+
+def test_forward():
+    opt = op.Forward(mat=2.0, strike=100, spot=100, rate=0.03, yld=0.01)
+    g = opt.gradient()
+    np.testing.assert_allclose(g['spot'], bumped(opt).Delta(), rtol=RTOL)
+    np.testing.assert_allclose(0.01 * g['rate'], bumped(opt).Rho(), rtol=RTOL, atol=ATOL)
+    np.testing.assert_allclose(0.01 * g['yld'], bumped(opt).RhoYld(), rtol=RTOL, atol=ATOL)
+
+
+def curves():
+    rate = op.Curve((0.5, 1.0, 2.0, 5.0), (0.02, 0.025, 0.03, 0.035))
+    yld = op.Curve((1.0, 3.0), (0.01, 0.015))
+    sig = op.VolCurve((0.25, 1.0, 2.0), (0.3, 0.25, 0.2))
+    return rate, yld, sig
+
+
+@pytest.mark.parametrize("cls", CLASSES)
+def test_curves(cls):
+    rate, yld, sig = curves()
+    check(cls(mat=1.5, strike=105, spot=100, rate=rate, yld=yld, sig=sig))
+
+
+@pytest.mark.parametrize("cls", CLASSES)
+def test_buckets(cls):
+    rate, yld, sig = curves()
+    opt = cls(mat=1.5, strike=105, spot=100, rate=rate, yld=yld, sig=sig)
+    g = opt.gradient()
+    np.testing.assert_allclose(0.01 * g['rate'], opt.RhoBuckets(), rtol=RTOL, atol=ATOL)
+    np.testing.assert_allclose(0.01 * g['sig'], opt.VegaBuckets(), rtol=RTOL, atol=ATOL)
+    b = bumped(opt)
+    np.testing.assert_allclose(0.01 * g['rate'], b.RhoBuckets(), rtol=RTOL, atol=ATOL)
+    np.testing.assert_allclose(0.01 * g['sig'], b.VegaBuckets(), rtol=RTOL, atol=ATOL)